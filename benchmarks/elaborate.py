@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import jb.justbuffers
+
+# Times elaboration of generated specs with many types, to check that it
+# scales linearly with the number of types. The specs are the worst
+# case for naive elaboration:
+#
+#   - types are listed in reverse dependency order, so every member is
+#     a forward reference
+#   - type n contains types n-1 and n-2 (the diamond-shaped graph of
+#     a Fibonacci recursion), so the number of paths through the type
+#     graph grows exponentially with its depth
+#
+# The chains are as deep as the default nesting limit allows, and their
+# records stay within the default size limit; bigger specs just have
+# more chains.
+
+
+def makeSpec(n_types, depth):
+    spec = {}
+    for i in range(n_types):
+        level = i % depth
+        members = [ { 'name': 'id', 'type': 'u32' } ]
+        if level >= 1:
+            members.append({ 'name': 'a', 'type': f't{i - 1}' })
+        if level >= 2:
+            members.append({ 'name': 'b', 'type': f't{i - 2}' })
+        members.append({ 'name': 'tail', 'type': 'u8', 'counts': 3 })
+        spec[f't{i}'] = members
+    return dict(reversed(list(spec.items())))
+
+
+def timeElaboration(n_types, depth, repeat):
+    spec = makeSpec(n_types, depth)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        jb.justbuffers.JustBufferator(spec, max_nesting_depth=depth)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def getArgs():
+    ap = argparse.ArgumentParser(description='time elaboration of generated specs with many types')
+    ap.add_argument('-n', '--types', type=int, nargs='+', default=[100, 1000, 10000],
+                    help='numbers of types to time')
+    ap.add_argument('-d', '--depth', type=int, default=16,
+                    help='nesting depth of the generated chains of types')
+    ap.add_argument('-r', '--repeat', type=int, default=3,
+                    help='runs per size; the best is reported')
+    return ap.parse_args()
+
+
+if __name__ == '__main__':
+    args = getArgs()
+    print(f'{"types":>8} {"seconds":>10} {"us/type":>10}')
+    for n_types in args.types:
+        elapsed = timeElaboration(n_types, args.depth, args.repeat)
+        print(f'{n_types:8} {elapsed:10.4f} {elapsed / n_types * 1e6:10.1f}')
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import jb.justbuffers
+import jb.randomspec
+
+# Times encoding, decoding and elaboration over a fixed set of specs, so
+# that changes in throughput show up from one run to the next:
+#
+#   ./benchmarks/suite.py -o before.json
+#   ... change things ...
+#   ./benchmarks/suite.py -o after.json --compare before.json
+#
+# Every benchmark is named spec.type.operation and reports:
+#   per_s            records (specs, for elaborate) handled per second
+#   mb_per_s         record bytes handled per second
+#   blocks_per_item  memory blocks held by the result, per record: the
+#                    objects an operation leaves the caller with
+#   peak_bytes       peak memory traced while the operation runs once
+#
+# With --compare, benchmarks that got slower by more than --threshold,
+# or whose peak memory grew by more than that, are listed as regressions
+# and the exit status is 1.
+
+RESULTS_VERSION = 1
+
+# how many bytes of records the *Many operations handle per call
+BATCH_BYTES = 1 << 20
+
+FIXED_SPECS = {
+    # the c_simple test spec: nested arrays of structs, and a big u8 array
+    'simple': ('t1', {
+        't0': [
+            { 'type': 'u32', 'name': 'fee' },
+            { 'type': 'u16', 'name': 'fi' },
+            { 'type': 'u64', 'name': 'fo' },
+            { 'type': 'u8',  'name': 'fum', 'counts': 128 },
+        ],
+        't1': [
+            { 'type': 't0', 'name': 't0s', 'counts': [2,2] },
+            { 'type': 'u16', 'name': 'blee' },
+        ],
+    }),
+    # a small record of the kind sent by the million
+    'small': ('tick', {
+        'tick': [
+            { 'type': 'u32', 'name': 'seq' },
+            { 'type': 'u8',  'name': 'kind' },
+            { 'type': 'u8',  'name': 'flags' },
+            { 'type': 'u16', 'name': 'length' },
+            { 'type': 'double', 'name': 'value' },
+        ],
+    }),
+    # big arrays of numbers, where per-element work dominates
+    'arrays': ('frame', {
+        'frame': [
+            { 'type': 'u64', 'name': 'timestamp' },
+            { 'type': 'float', 'name': 'samples', 'counts': 4096 },
+            { 'type': 'u16', 'name': 'image', 'counts': [64, 64] },
+            { 'type': 'u8',  'name': 'payload', 'counts': 8192 },
+        ],
+    }),
+    # strings
+    'strings': ('person', {
+        'person': [
+            { 'type': 'u32',  'name': 'id' },
+            { 'type': 'char', 'name': 'name', 'counts': 32 },
+            { 'type': 'char', 'name': 'tags', 'counts': [4, 16] },
+        ],
+    }),
+}
+
+# nesting eight levels deep, two of each level in the next
+DEEP_LEVELS = 8
+
+
+def makeDeepSpec():
+    spec = { 'level0': [ { 'type': 'u32', 'name': 'x' }, { 'type': 'float', 'name': 'y' } ] }
+    for i in range(1, DEEP_LEVELS):
+        spec[f'level{i}'] = [
+            { 'type': 'u16', 'name': 'id' },
+            { 'type': f'level{i - 1}', 'name': 'inner', 'counts': 2 },
+            { 'type': 'u8', 'name': 'flags', 'counts': 4 },
+        ]
+    return f'level{DEEP_LEVELS - 1}', spec
+
+
+# Random specs are drawn from a fixed seed until one fits the default
+# limits, so every run gets the same ones.
+def makeRandomSpec(seed):
+    random.seed(seed)
+    while True:
+        top, spec = jb.randomspec.makeSpecObject()
+        try:
+            jb.justbuffers.JustBufferator(spec)
+            return top, spec
+        except jb.justbuffers.ElaborationError:
+            pass
+
+
+# returns (benchmark spec name, type name, spec, bufferator options)
+def getSpecs():
+    specs = [ (name, t_name, spec, {}) for name, (t_name, spec) in FIXED_SPECS.items() ]
+    t_name, spec = FIXED_SPECS['arrays']
+    specs.append(('arrays-compact', t_name, spec, { 'compact_arrays': True }))
+    specs.append(('deep',) + makeDeepSpec() + ({},))
+    for seed in (1, 2, 3):
+        specs.append((f'random{seed}',) + makeRandomSpec(seed) + ({},))
+    return specs
+
+
+# Calls fn repeatedly for at least min_time seconds, repeat times over,
+# and returns the best time per call. As with timeit, the garbage
+# collector is off while timing.
+def timeCall(fn, min_time, repeat):
+    best = None
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            calls = 0
+            start = time.perf_counter()
+            while True:
+                fn()
+                calls += 1
+                elapsed = time.perf_counter() - start
+                if elapsed >= min_time:
+                    break
+            per_call = elapsed / calls
+            best = per_call if best is None else min(best, per_call)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return best
+
+
+def measureMemory(fn):
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    held = sys.getallocatedblocks() - blocks
+    del result
+    return max(held, 0), peak
+
+
+# returns (operation name, function, records per call, bytes per call)
+def getOperations(name, t_name, spec, options):
+    j = jb.justbuffers.JustBufferator(spec, **options)
+    size = j.elaborated[t_name]['size']
+    count = max(1, min(10000, BATCH_BYTES // size))
+    rng = random.Random(name)
+    data = rng.randbytes(size * count)
+    values = j.decodeMany(t_name, data)
+    one_buffer = data[:size]
+    one_value = values[0]
+    return [
+        ('elaborate', lambda: jb.justbuffers.JustBufferator(spec, **options), 1, 0),
+        ('encodeBuffer', lambda: j.encodeBuffer(t_name, one_value), 1, size),
+        ('decodeBuffer', lambda: j.decodeBuffer(t_name, one_buffer), 1, size),
+        ('encodeMany', lambda: j.encodeMany(t_name, values), count, size * count),
+        ('decodeMany', lambda: j.decodeMany(t_name, data), count, size * count),
+    ]
+
+
+def runAll(args):
+    results = {}
+    for name, t_name, spec, options in getSpecs():
+        for op_name, fn, items, nbytes in getOperations(name, t_name, spec, options):
+            key = f'{name}.{t_name}.{op_name}'
+            if args.filter and not any(f in key for f in args.filter):
+                continue
+            # a first call, untimed, compiles the codec
+            fn()
+            seconds = timeCall(fn, args.min_time, args.repeat)
+            blocks, peak = measureMemory(fn)
+            results[key] = {
+                'seconds': seconds,
+                'per_s': items / seconds,
+                'mb_per_s': nbytes / seconds / 1e6 if nbytes else None,
+                'blocks_per_item': blocks / items,
+                'peak_bytes': peak,
+            }
+            showResult(key, results[key])
+    return results
+
+
+def showHeader():
+    print(f'{"benchmark":44} {"per s":>12} {"MB/s":>9} {"blocks/item":>12} {"peak KiB":>10}')
+
+
+def showResult(key, r):
+    mb = f'{r["mb_per_s"]:9.1f}' if r['mb_per_s'] is not None else f'{"-":>9}'
+    print(f'{key:44} {r["per_s"]:12.1f} {mb} {r["blocks_per_item"]:12.1f} {r["peak_bytes"] / 1024:10.1f}')
+
+
+# prints how each benchmark changed, and returns the names of the ones
+# that regressed
+def compare(old, new, threshold):
+    print()
+    print(f'{"benchmark":44} {"old per s":>12} {"new per s":>12} {"speed":>8} {"peak":>8}')
+    regressions = []
+    for key, r in new.items():
+        o = old.get(key)
+        if o is None:
+            continue
+        speed = r['per_s'] / o['per_s']
+        peak = r['peak_bytes'] / o['peak_bytes'] if o['peak_bytes'] else 1.0
+        flag = ''
+        if speed < 1 - threshold or peak > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(key)
+        print(f'{key:44} {o["per_s"]:12.1f} {r["per_s"]:12.1f} {speed:7.2f}x {peak:7.2f}x{flag}')
+    missing = len(set(old) - set(new))
+    if missing:
+        print(f'{missing} benchmarks of the old results were not run this time')
+    return regressions
+
+
+def getArgs():
+    ap = argparse.ArgumentParser(description='time Just Buffers encoding, decoding and elaboration')
+    ap.add_argument('-o', '--output', type=str, default=None,
+                    help='save the results to this json file')
+    ap.add_argument('-c', '--compare', type=str, default=None,
+                    help='compare against results saved earlier with --output')
+    ap.add_argument('--threshold', type=float, default=0.1,
+                    help='with --compare, the fractional slowdown or peak memory growth counted as a regression')
+    ap.add_argument('-f', '--filter', type=str, nargs='+', default=None,
+                    help='only run benchmarks whose names contain one of these strings')
+    ap.add_argument('--min-time', type=float, default=0.2,
+                    help='seconds to keep calling each operation for, per round')
+    ap.add_argument('-r', '--repeat', type=int, default=3,
+                    help='rounds per benchmark; the best is reported')
+    ap.add_argument('--quick', action='store_true',
+                    help='one short round per benchmark, for a rough check')
+    return ap.parse_args()
+
+
+if __name__ == '__main__':
+    args = getArgs()
+    if args.quick:
+        args.min_time = 0.02
+        args.repeat = 1
+    old = None
+    if args.compare:
+        with open(args.compare, 'r') as ifh:
+            old = json.loads(ifh.read())
+        if old.get('version') != RESULTS_VERSION:
+            print(f'{args.compare} holds results of version {old.get("version")}, not {RESULTS_VERSION}')
+            sys.exit(-1)
+
+    showHeader()
+    results = runAll(args)
+
+    if args.output:
+        with open(args.output, 'w') as ofh:
+            ofh.write(json.dumps({
+                'version': RESULTS_VERSION,
+                'when': datetime.datetime.now().isoformat(),
+                'python': sys.version,
+                'platform': platform.platform(),
+                'results': results,
+            }, indent=2))
+
+    if old is not None:
+        regressions = compare(old['results'], results, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regressions')
+            sys.exit(1)
+    sys.exit(0)
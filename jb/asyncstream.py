@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import asyncio
+
+from . import stream
+
+# Reading and writing records on asyncio streams:
+#
+#   async for record in asyncstream.records(j, reader, 't1'):
+#       ...
+#   await asyncstream.writeRecord(j, writer, 't1', record)
+#
+# Each connection costs one RecordParser, which holds at most one
+# partial record between reads, so a process can serve thousands of
+# them. Reads happen only as the consumer asks for records, so a slow
+# consumer leaves data in the socket and asyncio's flow control pushes
+# back on the sender; writes wait for the transport to drain.
+
+
+# Yields the records of one type read from an asyncio StreamReader,
+# until the stream ends. Every read decodes all the whole records it
+# completes in one go.
+#
+# Decoding a big read can hold up the event loop for a while. Given an
+# executor (usually a concurrent.futures.ThreadPoolExecutor, as the
+# bufferator can't be pickled for a process pool), reads of at least
+# offload_bytes are decoded in it instead.
+async def records(bufferator, reader, t_name, read_size=65536, executor=None, offload_bytes=16384):
+    parser = stream.RecordParser(bufferator, t_name)
+    loop = asyncio.get_running_loop()
+    while True:
+        data = await reader.read(read_size)
+        if not data:
+            break
+        if executor is not None and len(data) >= offload_bytes:
+            batch = await loop.run_in_executor(executor, parser.feed, data)
+        else:
+            batch = parser.feed(data)
+        for record in batch:
+            yield record
+    # raises EOFError if the stream ended inside a record
+    parser.close()
+
+
+# Encodes one record onto an asyncio StreamWriter, and waits until the
+# writer is ready for more.
+async def writeRecord(bufferator, writer, t_name, data):
+    writer.write(bufferator.encodeBuffer(t_name, data))
+    await writer.drain()
+
+
+# Same, for many records at once, with a single write.
+async def writeRecords(bufferator, writer, t_name, values):
+    writer.write(bufferator.encodeMany(t_name, values))
+    await writer.drain()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import gc
+import hashlib
+import json
+import marshal
+import os
+import sys
+import tempfile
+
+# An on-disk cache of elaborated specs. Each entry is a file named after
+# a hash of everything elaboration depends on: the spec itself, packing,
+# and the limits it was checked against. Loading an entry replaces
+# schema validation and elaboration with a file read.
+#
+# Entries are written with marshal, which loads plain dicts and lists
+# several times faster than json does (json entries would take as long
+# to load as elaborating the spec). marshal can't run code, but it isn't
+# hardened against deliberately malformed data either, so only use a
+# cache directory that untrusted users can't write to. Entries that
+# can't be read or don't look right are ignored and rewritten.
+
+# bump whenever the elaborated layout changes shape, so that entries
+# written by older versions are never used
+CACHE_VERSION = 1
+
+
+def elaborationKey(configs, packed, max_array_elements, max_struct_size, max_nesting_depth):
+    # the order of types and members is kept: it is the order of the
+    # elaborated types and of the generated code. marshal's format can
+    # change between python versions, so those get separate entries.
+    spec = json.dumps(
+        [CACHE_VERSION, sys.implementation.cache_tag, configs, packed,
+         max_array_elements, max_struct_size, max_nesting_depth],
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(spec.encode('utf-8')).hexdigest()
+
+
+def entryPath(cache_dir, key):
+    return os.path.join(cache_dir, f'{key}.elab')
+
+
+# returns (elaborated, messages), or None if there is no usable entry
+def load(cache_dir, key):
+    try:
+        with open(entryPath(cache_dir, key), 'rb') as ifh:
+            data = ifh.read()
+        # an entry is a tree of a great many small dicts and lists, and
+        # none of them can be garbage, so don't let the collector keep
+        # rescanning them while they are made
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            entry = marshal.loads(data)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        if entry['version'] != CACHE_VERSION or entry['key'] != key:
+            return None
+        return entry['elaborated'], entry['messages']
+    except (OSError, EOFError, ValueError, KeyError, TypeError):
+        return None
+
+
+# writes an entry atomically, so that concurrent builds sharing a cache
+# never see a partial one
+def store(cache_dir, key, elaborated, messages):
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.tmp-', suffix='.elab')
+    try:
+        with os.fdopen(fd, 'wb') as ofh:
+            ofh.write(marshal.dumps({
+                'version': CACHE_VERSION,
+                'key': key,
+                'elaborated': elaborated,
+                'messages': messages,
+            }))
+        os.replace(tmp_path, entryPath(cache_dir, key))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+import struct
+import zlib
+
+# Framing for streams that mix records of several types. Every record
+# is preceded by a fixed 16 byte header that says which type it is, so a
+# reader can route each frame with one lookup of the type id in a table
+# built from the spec, rather than by trying types until one decodes.
+#
+# The header is, in little-endian order whatever the byte order of the
+# records:
+#   magic    2 bytes  b'JF'
+#   version  u8
+#   flags    u8       FLAG_CRC: crc holds the CRC-32 of the record
+#                     FLAG_BIG_ENDIAN: the record is big-endian
+#   type_id  u32      JustBufferator.typeId() of the record's type
+#   length   u32      size of the record that follows, in bytes
+#   crc      u32      zlib.crc32() of the record, or 0
+# and the record follows it directly. 16 bytes keeps records that start
+# aligned in a buffer aligned.
+#
+# Type ids don't depend on byte order, so a reader checks the
+# FLAG_BIG_ENDIAN of a frame against its own byte order instead.
+#
+# The C and C++ headers from jb.py carry the same type ids, along with
+# helpers to read and write frames in the host's byte order (see
+# generators/frames.py).
+
+FRAME_MAGIC = b'JF'
+FRAME_VERSION = 1
+FLAG_CRC = 0x01
+FLAG_BIG_ENDIAN = 0x02
+HEADER_STRUCT = struct.Struct('<2sBBIII')
+
+
+class FramingError(Exception):
+    """Raised when a frame is malformed, corrupt or of an unknown type"""
+    pass
+
+
+class Framer():
+
+    # With crc=True, frames written carry a CRC of their record. Frames
+    # read are checked if they carry one, whatever crc is set to.
+    #
+    # With skip_unknown=True, frames of types not in the spec are
+    # skipped over (their length says how far) instead of raising.
+    def __init__(self, bufferator, crc=False, skip_unknown=False):
+        self.bufferator = bufferator
+        self.crc = crc
+        self.skip_unknown = skip_unknown
+        self.byte_order_flag = FLAG_BIG_ENDIAN if bufferator.pack_endian == '>' else 0
+        # type name -> type id, and type id -> (type name, record size)
+        self.ids = {}
+        self.table = {}
+        for t_name, t_info in bufferator.elaborated.items():
+            type_id = bufferator.typeId(t_name)
+            if type_id in self.table:
+                raise FramingError(
+                    f'types "{self.table[type_id][0]}" and "{t_name}" have the same type id '
+                    f'0x{type_id:08x}; rename one of them'
+                )
+            self.ids[t_name] = type_id
+            self.table[type_id] = (t_name, t_info['size'])
+
+    # Returns one frame holding data encoded as t_name.
+    def encodeFrame(self, t_name, data):
+        size = self.bufferator.elaborated[t_name]['size']
+        frame = bytearray(HEADER_STRUCT.size + size)
+        self.encodeFrameInto(t_name, data, frame)
+        return bytes(frame)
+
+    # Writes a frame straight into buffer at offset, as encodeInto does
+    # for a bare record. Returns the number of bytes written.
+    def encodeFrameInto(self, t_name, data, buffer, offset=0):
+        start = offset + HEADER_STRUCT.size
+        size = self.bufferator.encodeInto(t_name, data, buffer, start)
+        flags = self.byte_order_flag
+        crc = 0
+        if self.crc:
+            flags |= FLAG_CRC
+            with memoryview(buffer) as mv, mv.cast('B') as raw:
+                crc = zlib.crc32(raw[start:start + size])
+        HEADER_STRUCT.pack_into(
+            buffer, offset, FRAME_MAGIC, FRAME_VERSION, flags, self.ids[t_name], size, crc
+        )
+        return HEADER_STRUCT.size + size
+
+    # Returns all of values, a list of (type name, data) pairs, as
+    # consecutive frames.
+    def encodeFrames(self, values):
+        elaborated = self.bufferator.elaborated
+        total = sum(HEADER_STRUCT.size + elaborated[t_name]['size'] for t_name, _ in values)
+        frames = bytearray(total)
+        offset = 0
+        for t_name, data in values:
+            offset += self.encodeFrameInto(t_name, data, frames, offset)
+        return bytes(frames)
+
+    # Checks the header of the frame at offset and returns
+    # (type name, offset of the record, offset of the next frame), or
+    # None if data ends before the frame does. The type name is None
+    # for a skipped frame of an unknown type.
+    #
+    # Everything the header alone can show to be wrong is raised before
+    # waiting on the rest of the frame, so a corrupt length is reported
+    # at once rather than buffered for. Only a skipped frame is waited
+    # on for the length it claims.
+    def __readHeader(self, raw, offset):
+        if raw.nbytes - offset < HEADER_STRUCT.size:
+            return None
+        magic, version, flags, type_id, length, crc = HEADER_STRUCT.unpack_from(raw, offset)
+        if magic != FRAME_MAGIC:
+            raise FramingError(f'no frame header at offset {offset}')
+        if version != FRAME_VERSION:
+            raise FramingError(f'frame at offset {offset} has unsupported version {version}')
+        start = offset + HEADER_STRUCT.size
+        end = start + length
+
+        entry = self.table.get(type_id)
+        if entry is None:
+            if not self.skip_unknown:
+                raise FramingError(f'frame at offset {offset} has unknown type id 0x{type_id:08x}')
+            if end > raw.nbytes:
+                return None
+            return None, start, end
+        t_name, size = entry
+        if length != size:
+            raise FramingError(
+                f'frame at offset {offset} holds {length} bytes, but "{t_name}" records are {size}'
+            )
+        if flags & FLAG_BIG_ENDIAN != self.byte_order_flag:
+            order = 'big' if flags & FLAG_BIG_ENDIAN else 'little'
+            raise FramingError(
+                f'frame at offset {offset} ("{t_name}") is {order}-endian, but the bufferator is not'
+            )
+        if end > raw.nbytes:
+            return None
+        if flags & FLAG_CRC and zlib.crc32(raw[start:end]) != crc:
+            raise FramingError(f'frame at offset {offset} ("{t_name}") failed its CRC check')
+        return t_name, start, end
+
+    # Decodes the frame at offset and returns (type name, record, offset
+    # of the next frame). A skipped frame of an unknown type comes back
+    # with None for both type name and record.
+    def decodeFrame(self, data, offset=0):
+        with memoryview(data) as mv, mv.cast('B') as raw:
+            header = self.__readHeader(raw, offset)
+            if header is None:
+                raise FramingError(f'frame at offset {offset} runs past the end of the data')
+            t_name, start, end = header
+            if t_name is None:
+                return None, None, end
+            return t_name, self.bufferator.decodeBuffer(t_name, raw, start), end
+
+    # Decodes every whole frame in data from offset on, and returns a
+    # list of (type name, record) pairs along with the offset just past
+    # the last of them. Skipped frames are left out.
+    def decodeFrames(self, data, offset=0):
+        decodeBuffer = self.bufferator.decodeBuffer
+        records = []
+        with memoryview(data) as mv, mv.cast('B') as raw:
+            while True:
+                header = self.__readHeader(raw, offset)
+                if header is None:
+                    break
+                t_name, start, offset = header
+                if t_name is not None:
+                    records.append((t_name, decodeBuffer(t_name, raw, start)))
+        return records, offset
+
+
+# Push parser for a stream of frames: feed() it bytes as they arrive and
+# it returns the (type name, record) pairs they complete. At most one
+# partial frame is buffered between calls.
+#
+# If handlers, a dict of type name to function, is given, each record
+# of a type that has a handler is passed to it rather than returned.
+class Dispatcher():
+
+    def __init__(self, framer, handlers=None):
+        self.framer = framer
+        self.handlers = handlers or {}
+        self.pending = bytearray()
+
+    def feed(self, data):
+        if self.pending:
+            self.pending += data
+            records, used = self.framer.decodeFrames(self.pending)
+            del self.pending[:used]
+        else:
+            records, used = self.framer.decodeFrames(data)
+            with memoryview(data) as mv, mv.cast('B') as raw:
+                self.pending += raw[used:]
+
+        if not self.handlers:
+            return records
+        unhandled = []
+        for t_name, record in records:
+            handler = self.handlers.get(t_name)
+            if handler is None:
+                unhandled.append((t_name, record))
+            else:
+                handler(record)
+        return unhandled
+
+    # number of bytes of an incomplete frame being held
+    def buffered(self):
+        return len(self.pending)
+
+    # call at the end of the stream to check no partial frame is left
+    def close(self):
+        if self.pending:
+            raise EOFError(f'stream ended {len(self.pending)} bytes into a frame')
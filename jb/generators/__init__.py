@@ -1,2 +1,4 @@
 from . import cpp
 from . import c
+from . import python
+from . import frames
@@ -3,8 +3,11 @@
 import sys
 import datetime
 from .. import util
+from . import frames
 
-def generate(typeinfo, elaborated, packed):
+# With type_ids (type name -> frame type id), the header also gets the
+# frame helpers of frames.py.
+def generate(typeinfo, elaborated, packed, type_ids=None):
     packed = '__attribute__((packed))' if packed else ''
     os = [ f'''
 #pragma once
@@ -36,4 +39,8 @@ f'''}} {t_name};
 STATIC_ASSERT(sizeof({t_name}) == 0x{t_info["size"]:x});
 '''     )
 
+    if type_ids is not None:
+        os += frames.gen_type_ids(type_ids)
+        os += frames.gen_helpers(type_ids)
+
     return '\n'.join(os)
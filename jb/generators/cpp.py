@@ -3,6 +3,7 @@
 import datetime
 import sys
 from .. import util
+from . import frames
 
 
 def gen_prolog():
@@ -12,6 +13,8 @@ def gen_prolog():
 // *** DO NOT EDIT ***
 
 #pragma once
+#include <algorithm>
+#include <cstring>
 #include <map>
 #include <string>
 #include <stdint.h>
@@ -40,13 +43,23 @@ def gen_constructors(t_name):
 
 ''']
 
+# the last dimension of a char array is the length of its strings, so
+# the json has one string per row: char name[3][16] becomes an array of
+# 3 strings. Strings are NUL padded, but need not be NUL terminated when
+# they fill the whole row.
+def is_string_array(m_info):
+    return m_info['type'] == 'char' and len(m_info['counts']) > 1
+
+
 def gen_toJS(typeinfo, t_info, elaborated):
     os = []
     os.append('    nlohmann::json toJS() const {')
     for m_info in t_info['members']:
         m_name = m_info['name']
-        if m_info['type'] in elaborated and not util.is_scalar(m_info):
+        if (m_info['type'] in elaborated and not util.is_scalar(m_info)) or is_string_array(m_info):
             counts = m_info['counts']
+            if m_info['type'] == 'char':
+                counts = counts[:-1]
             ivars = [f"idx{n}" for n in range(len(counts))]
             idx_s = ']['.join(ivars)
             for lidx in range(len(counts)):
@@ -61,7 +74,12 @@ def gen_toJS(typeinfo, t_info, elaborated):
 
             for lidx in reversed(range(len(counts))):
                 name = f'{m_name}_temp_{lidx}'
-                if lidx == len(counts) - 1:
+                if lidx == len(counts) - 1 and m_info['type'] == 'char':
+                    os.append(
+                        '  ' * lidx
+                        + f'        {name}.push_back(std::string({m_name}[{idx_s}], strnlen({m_name}[{idx_s}], {m_info["counts"][-1]})));'
+                    )
+                elif lidx == len(counts) - 1:
                     os.append('  ' * lidx + f'        {name}.push_back({m_name}[{idx_s}].toJS());')
                 else:
                     prev_name = f'{m_name}_temp_{lidx+1}'
@@ -75,8 +93,12 @@ def gen_toJS(typeinfo, t_info, elaborated):
         m_name = m_info['name']
         if m_info['type'] in elaborated and util.is_scalar(m_info):
             os.append(f'        {{ "{m_name}", {m_name}.toJS() }},')
-        elif m_info['type'] in elaborated:
+        elif m_info['type'] in elaborated or is_string_array(m_info):
             os.append(f'        {{ "{m_name}", {m_info["vec_name"]} }},')
+        elif m_info['type'] == 'char':
+            # a lone char is declared as a plain char, not an array
+            ptr = f'&{m_name}' if util.is_scalar(m_info) else m_name
+            os.append(f'        {{ "{m_name}", std::string({ptr}, strnlen({ptr}, {m_info["counts"][-1]})) }},')
         else:
             os.append(f'        {{ "{m_name}", {m_name} }},')
     os.append('      };')
@@ -94,7 +116,27 @@ def gen_fromJS(t_info, elaborated):
     for m_info in t_info['members']:
         m_name = m_info['name']
         os.append(f'      if (j.contains("{m_name}")) {{')
-        if util.is_scalar(m_info):
+        if m_info['type'] == 'char':
+            counts = m_info['counts'][:-1]
+            length = m_info['counts'][-1]
+            ivars = [f"idx{n}" for n in range(len(counts))]
+            for lidx in range(len(counts)):
+                ivar = ivars[lidx]
+                os.append(
+                    idx_indent(lidx)
+                    + f'        for (size_t {ivar}=0; {ivar} < {counts[lidx]}; {ivar}++) {{'
+                )
+            dst = m_name + ''.join([ f'[{ivar}]' for ivar in ivars ])
+            if util.is_scalar(m_info):
+                dst = f'&{dst}'
+            src = f'j.at("{m_name}")' + ''.join([ f'[{ivar}]' for ivar in ivars ])
+            indent = idx_indent(len(counts)) + '        '
+            os.append(f'{indent}const std::string s = {src};')
+            os.append(f'{indent}memset({dst}, 0, {length});')
+            os.append(f'{indent}memcpy({dst}, s.data(), std::min(s.size(), (size_t){length}));')
+            for lidx in range(len(counts)):
+                os.append( idx_indent(len(counts) - lidx - 1) + '        }')
+        elif util.is_scalar(m_info):
             if m_info['type'] in elaborated:
                 os.append(f'        {m_name}.fromJS(j.at("{m_name}"));')
             else:
@@ -130,7 +172,27 @@ def gen_fromJS(t_info, elaborated):
     return os
 
 
-def generate(typeinfo, elaborated, packed=False):
+# jb_type_id<T>::value is the frame type id of class T, so frames can be
+# written without naming the id
+def gen_frame_templates(type_ids):
+    os = [ 'template <typename T> struct jb_type_id;' ]
+    for t_name in type_ids:
+        os.append(f'template <> struct jb_type_id<{t_name}> {{ static constexpr uint32_t value = JB_TYPE_ID_{t_name}; }};')
+    os.append('''
+// returns a frame holding t
+template <typename T>
+std::string jb_frame(const T &t, bool with_crc = false) {
+  std::string frame(JB_FRAME_HEADER_SIZE + sizeof(T), '\\0');
+  jb_frame_write(&frame[0], frame.size(), jb_type_id<T>::value, &t, sizeof(T), with_crc);
+  return frame;
+}
+''')
+    return os
+
+
+# With type_ids (type name -> frame type id), the header also gets the
+# frame helpers of frames.py.
+def generate(typeinfo, elaborated, packed=False, type_ids=None):
     os = [ gen_prolog() ]
     packed = '__attribute__((packed))' if packed else ''
     for t_name, t_info in elaborated.items():
@@ -145,5 +207,10 @@ def generate(typeinfo, elaborated, packed=False):
         os.append('')
         os.append(f'static_assert(sizeof({t_name}) == 0x{t_info["size"]:x}, "sizeof {t_name} not what justbuffers expected; this is a bug");')
         os.append('')
+
+    if type_ids is not None:
+        os += frames.gen_type_ids(type_ids)
+        os += frames.gen_helpers(type_ids)
+        os += gen_frame_templates(type_ids)
     return '\n'.join(os)
 
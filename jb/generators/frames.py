@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+# Helpers for reading and writing the frames of jb/framing.py, shared by
+# the C and C++ headers. The code is plain C that also compiles as C++.
+# Header fields are read and written a byte at a time, so it works the
+# same on hosts of either byte order. Records are in the host's byte
+# order, which frames written say in their flags, and frames read are
+# checked against.
+
+def gen_type_ids(type_ids):
+    os = [ '// frame type ids, as JustBufferator.typeId() computes them' ]
+    for t_name, type_id in type_ids.items():
+        os.append(f'#define JB_TYPE_ID_{t_name} 0x{type_id:08x}u')
+    os.append('')
+    return os
+
+
+def gen_helpers(type_ids):
+    os = [ '''
+#include <stddef.h>
+#include <string.h>
+
+#define JB_FRAME_HEADER_SIZE 16
+#define JB_FRAME_VERSION 1
+#define JB_FRAME_FLAG_CRC 0x01
+#define JB_FRAME_FLAG_BIG_ENDIAN 0x02
+
+// returned by jb_frame_read
+#define JB_FRAME_INCOMPLETE 0
+#define JB_FRAME_BAD_HEADER -1
+#define JB_FRAME_BAD_CRC -2
+#define JB_FRAME_BAD_BYTE_ORDER -3
+#define JB_FRAME_BAD_LENGTH -4
+
+typedef struct jb_frame_header {
+  uint8_t  flags;
+  uint32_t type_id;
+  uint32_t length;
+  uint32_t crc;
+} jb_frame_header;
+
+static inline uint32_t jb_get_u32le(const uint8_t *p) {
+  return (uint32_t)p[0] | ((uint32_t)p[1] << 8) | ((uint32_t)p[2] << 16) | ((uint32_t)p[3] << 24);
+}
+
+static inline void jb_put_u32le(uint8_t *p, uint32_t v) {
+  p[0] = (uint8_t)v; p[1] = (uint8_t)(v >> 8); p[2] = (uint8_t)(v >> 16); p[3] = (uint8_t)(v >> 24);
+}
+
+// JB_FRAME_FLAG_BIG_ENDIAN on a big-endian host, 0 on a little-endian one
+static inline uint8_t jb_byte_order_flag(void) {
+  const uint16_t one = 1;
+  return *(const uint8_t *)&one ? 0 : JB_FRAME_FLAG_BIG_ENDIAN;
+}
+
+// the CRC-32 of zlib.crc32()
+static inline uint32_t jb_crc32(const void *data, size_t len) {
+  const uint8_t *p = (const uint8_t *)data;
+  uint32_t crc = 0xffffffffu;
+  for (size_t i = 0; i < len; i++) {
+    crc ^= p[i];
+    for (int b = 0; b < 8; b++) {
+      crc = (crc >> 1) ^ (0xedb88320u & (0u - (crc & 1u)));
+    }
+  }
+  return ~crc;
+}
+
+// Writes a frame holding the len byte record at out. Returns the size
+// of the frame, or 0 if it doesn't fit in out_len bytes.
+static inline size_t jb_frame_write(void *out, size_t out_len, uint32_t type_id,
+                                    const void *record, size_t len, int with_crc) {
+  uint8_t *p = (uint8_t *)out;
+  if (out_len < JB_FRAME_HEADER_SIZE + len) {
+    return 0;
+  }
+  p[0] = 'J';
+  p[1] = 'F';
+  p[2] = JB_FRAME_VERSION;
+  p[3] = (uint8_t)(jb_byte_order_flag() | (with_crc ? JB_FRAME_FLAG_CRC : 0));
+  jb_put_u32le(p + 4, type_id);
+  jb_put_u32le(p + 8, (uint32_t)len);
+  jb_put_u32le(p + 12, with_crc ? jb_crc32(record, len) : 0);
+  memcpy(p + JB_FRAME_HEADER_SIZE, record, len);
+  return JB_FRAME_HEADER_SIZE + len;
+}
+
+static inline size_t jb_type_size(uint32_t type_id);
+
+// Reads the frame at the start of in_len bytes at in. On success fills
+// in header, points record at the record and returns the size of the
+// whole frame. Returns JB_FRAME_INCOMPLETE if more bytes are needed, or
+// a negative JB_FRAME_BAD_ code. The header is checked before waiting
+// on the rest of the frame: JB_FRAME_BAD_LENGTH means the type id is
+// unknown or header->length isn't jb_type_size() of it.
+static inline long jb_frame_read(const void *in, size_t in_len,
+                                 jb_frame_header *header, const void **record) {
+  const uint8_t *p = (const uint8_t *)in;
+  if (in_len < JB_FRAME_HEADER_SIZE) {
+    return JB_FRAME_INCOMPLETE;
+  }
+  if (p[0] != 'J' || p[1] != 'F' || p[2] != JB_FRAME_VERSION) {
+    return JB_FRAME_BAD_HEADER;
+  }
+  header->flags = p[3];
+  header->type_id = jb_get_u32le(p + 4);
+  header->length = jb_get_u32le(p + 8);
+  header->crc = jb_get_u32le(p + 12);
+  if (jb_type_size(header->type_id) == 0 || jb_type_size(header->type_id) != header->length) {
+    return JB_FRAME_BAD_LENGTH;
+  }
+  if ((header->flags & JB_FRAME_FLAG_BIG_ENDIAN) != jb_byte_order_flag()) {
+    return JB_FRAME_BAD_BYTE_ORDER;
+  }
+  if (in_len - JB_FRAME_HEADER_SIZE < header->length) {
+    return JB_FRAME_INCOMPLETE;
+  }
+  *record = p + JB_FRAME_HEADER_SIZE;
+  if ((header->flags & JB_FRAME_FLAG_CRC) && jb_crc32(*record, header->length) != header->crc) {
+    return JB_FRAME_BAD_CRC;
+  }
+  return (long)(JB_FRAME_HEADER_SIZE + header->length);
+}
+''' ]
+
+    os.append('// size of the records of a type id, or 0 for an unknown type')
+    os.append('static inline size_t jb_type_size(uint32_t type_id) {')
+    os.append('  switch (type_id) {')
+    for t_name in type_ids:
+        os.append(f'    case JB_TYPE_ID_{t_name}: return sizeof({t_name});')
+    os.append('    default: return 0;')
+    os.append('  }')
+    os.append('}')
+    os.append('')
+    os.append('// name of the type of a type id, or NULL for an unknown type')
+    os.append('static inline const char *jb_type_name(uint32_t type_id) {')
+    os.append('  switch (type_id) {')
+    for t_name in type_ids:
+        os.append(f'    case JB_TYPE_ID_{t_name}: return "{t_name}";')
+    os.append('    default: return NULL;')
+    os.append('  }')
+    os.append('}')
+    os.append('')
+    return os
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+import datetime
+import sys
+from .. import util
+
+# Generates a standalone python module with one encode and one decode
+# function per type. The module has no dependency on Just Buffers: every
+# struct format, offset and size is baked in as a constant, so nothing
+# needs to be elaborated when it is imported.
+
+
+def gen_prolog(packed, big_endian):
+    return f'''#!/usr/bin/env python3
+#
+# This file was generated by: {sys.argv[0]}
+#                          at: {datetime.datetime.now().isoformat()}
+# packed: {packed}, big_endian: {big_endian}
+# *** DO NOT EDIT ***
+
+import struct
+
+
+def _flat(values, count, name):
+    if not isinstance(values, (list, tuple)):
+        flat = [values]
+    elif values and isinstance(values[0], (list, tuple)):
+        flat = []
+        stack = [values]
+        while stack:
+            a = stack.pop()
+            if a and isinstance(a[0], (list, tuple)):
+                stack.extend(reversed(a))
+            else:
+                flat.extend(a)
+    else:
+        flat = list(values)
+    if len(flat) > count:
+        raise struct.error(f'too many values for {{name}}: expected {{count}}, got {{len(flat)}}')
+    return flat
+
+
+def _str(raw):
+    return raw.split(b'\\0', 1)[0].decode('utf-8', errors='surrogateescape')
+
+
+def _bytes(s, size, name):
+    if isinstance(s, str):
+        s = s.encode('utf-8', errors='surrogateescape')
+    if len(s) > size:
+        raise struct.error(f'string of {{len(s)}} bytes is too long for {{name}}: at most {{size}}')
+    return s
+
+'''
+
+
+# number of flat values, flattened struct format and flat values of an
+# all-zero record of every type, relying on elaborated being in
+# dependency order. The zeros are runs of (value, count), b'' for the
+# rows of char arrays and 0 for everything else.
+def flat_layouts(typeinfo, elaborated):
+    widths = {}
+    formats = {}
+    zeros = {}
+    for t_name, t_info in elaborated.items():
+        width = 0
+        fmt = []
+        runs = []
+        def addZeros(value, count):
+            if runs and runs[-1][0] == value:
+                runs[-1] = (value, runs[-1][1] + count)
+            else:
+                runs.append((value, count))
+        for m_info in t_info['members']:
+            total_count = util.total_array_count(m_info)
+            if m_info['type'] == 'char':
+                # one whole string per row
+                width += total_count // m_info['counts'][-1]
+                fmt.append(f'{m_info["counts"][-1]}s' * (total_count // m_info['counts'][-1]))
+                addZeros("b''", total_count // m_info['counts'][-1])
+            elif m_info['type'] in typeinfo:
+                width += total_count
+                fmt.append(f'{total_count}{typeinfo[m_info["type"]]["pack"]}')
+                addZeros('0', total_count)
+            else:
+                width += total_count * widths[m_info['type']]
+                fmt.append(formats[m_info['type']] * total_count)
+                for _ in range(total_count):
+                    for value, count in zeros[m_info['type']]:
+                        addZeros(value, count)
+        widths[t_name] = width
+        formats[t_name] = ''.join(fmt)
+        zeros[t_name] = runs
+    return widths, formats, zeros
+
+
+def zeros_expr(runs):
+    return ' + '.join(f'({value},) * {count}' for value, count in runs) or '()'
+
+
+def index_expr(index, extra=None):
+    parts = ['i']
+    if index:
+        parts.append(str(index))
+    if extra is not None:
+        parts.append(extra)
+    return ' + '.join(parts)
+
+
+# the dimensions a member has once char rows count as single values
+def value_counts(m_info):
+    if m_info['type'] == 'char':
+        return m_info['counts'][:-1] or [1]
+    return m_info['counts']
+
+
+# builds the expression that turns the flat values of one member,
+# starting at flat index i + index, back into a (possibly nested) list
+def gen_member_expr(m_info, index, width, is_struct):
+    counts = value_counts(m_info)
+    m_type = m_info['type']
+
+    if len(counts) == 1 and counts[0] == 1:
+        if is_struct:
+            return f'_build_{m_type}(v, {index_expr(index)})'
+        elif m_type == 'bool':
+            return f'bool(v[{index_expr(index)}])'
+        elif m_type == 'char':
+            return f'_str(v[{index_expr(index)}])'
+        return f'v[{index_expr(index)}]'
+
+    def innermost(prefix, d):
+        if prefix is None:
+            start, end = index_expr(index), index_expr(index + d)
+        else:
+            start = index_expr(index, f'({prefix}) * {d * width}')
+            end = f'{start} + {d}'
+        if is_struct:
+            return f'[_build_{m_type}(v, {start} + k * {width}) for k in range({d})]'
+        elif m_type == 'bool':
+            return f'[bool(x) for x in v[{start}:{end}]]'
+        elif m_type == 'char':
+            return f'[_str(x) for x in v[{start}:{end}]]'
+        return f'list(v[{start}:{end}])'
+
+    def level(lidx, prefix):
+        d = counts[lidx]
+        if lidx == len(counts) - 1:
+            return innermost(prefix, d)
+        kvar = f'k{lidx}'
+        inner_prefix = kvar if prefix is None else f'({prefix}) * {d} + {kvar}'
+        return f'[{level(lidx + 1, inner_prefix)} for {kvar} in range({d})]'
+
+    return level(0, None)
+
+
+def gen_type(typeinfo, elaborated, t_name, endian, widths, formats, zeros):
+    t_info = elaborated[t_name]
+    os = []
+    os.append(f'# {t_name}: size 0x{t_info["size"]:x}, align 0x{t_info["align"]:x}')
+    os.append(f'{t_name}_size = 0x{t_info["size"]:x}')
+    os.append(f"_{t_name}_struct = struct.Struct('{endian}{formats[t_name]}')")
+    os.append(f'_{t_name}_zeros = {zeros_expr(zeros[t_name])}')
+    os.append('')
+
+    # decode: one unpack_from, then a literal dict per type
+    os.append(f'def _build_{t_name}(v, i):')
+    os.append('    return {')
+    index = 0
+    for m_info in t_info['members']:
+        is_struct = m_info['type'] not in typeinfo
+        width = widths[m_info['type']] if is_struct else 1
+        os.append(f"        '{m_info['name']}': {gen_member_expr(m_info, index, width, is_struct)},  # offset 0x{m_info['offset']:x}")
+        index += util.total_array_count({ 'counts': value_counts(m_info) }) * width
+    os.append('    }')
+    os.append('')
+    os.append(f'def decode_{t_name}(data, offset=0):')
+    os.append(f'    return _build_{t_name}(_{t_name}_struct.unpack_from(data, offset), 0)')
+    os.append('')
+
+    # encode: append the flat values in layout order, then one pack
+    os.append(f'def _flatten_{t_name}(data, out):')
+    for m_info in t_info['members']:
+        m_name = m_info['name']
+        total_count = util.total_array_count({ 'counts': value_counts(m_info) })
+        is_struct = m_info['type'] not in typeinfo
+        width = widths[m_info['type']] if is_struct else 1
+        zero = "b''" if m_info['type'] == 'char' else '0'
+        os.append(f"    x = data.get('{m_name}')")
+        os.append('    if x is None:')
+        if is_struct:
+            # a nested struct may hold strings, so it is filled from its
+            # own zeros rather than with 0s
+            if total_count == 1:
+                os.append(f'        out.extend(_{m_info["type"]}_zeros)')
+            else:
+                os.append(f'        out.extend(_{m_info["type"]}_zeros * {total_count})')
+        elif total_count * width == 1:
+            os.append(f'        out.append({zero})')
+        else:
+            os.append(f'        out.extend([{zero}] * {total_count * width})')
+        if m_info['type'] == 'char':
+            length = m_info['counts'][-1]
+            if total_count == 1:
+                os.append('    elif not isinstance(x, (list, tuple)):')
+                os.append(f"        out.append(_bytes(x, {length}, '{m_name}'))")
+            os.append('    else:')
+            os.append(f"        x = _flat(x, {total_count}, '{m_name}')")
+            os.append(f"        out.extend([_bytes(e, {length}, '{m_name}') for e in x])")
+            os.append(f"        out.extend([b''] * ({total_count} - len(x)))")
+        elif is_struct:
+            if total_count == 1:
+                os.append('    elif isinstance(x, dict):')
+                os.append(f'        _flatten_{m_info["type"]}(x, out)')
+            os.append('    else:')
+            os.append(f"        x = _flat(x, {total_count}, '{m_name}')")
+            os.append('        for e in x:')
+            os.append(f'            _flatten_{m_info["type"]}(e, out)')
+            os.append(f'        out.extend(_{m_info["type"]}_zeros * ({total_count} - len(x)))')
+        elif total_count == 1:
+            os.append('    elif not isinstance(x, (list, tuple)):')
+            os.append('        out.append(x)')
+            os.append('    else:')
+            os.append(f"        out.extend(_flat(x, 1, '{m_name}') or [0])")
+        else:
+            os.append('    else:')
+            os.append(f"        x = _flat(x, {total_count}, '{m_name}')")
+            os.append('        out.extend(x)')
+            os.append(f'        out.extend([0] * ({total_count} - len(x)))')
+    os.append('')
+    os.append(f'def encode_{t_name}(data):')
+    os.append('    out = []')
+    os.append(f'    _flatten_{t_name}(data, out)')
+    os.append(f'    return _{t_name}_struct.pack(*out)')
+    os.append('')
+    os.append('')
+    return os
+
+
+def generate(typeinfo, elaborated, packed=False, big_endian=False):
+    endian = '>' if big_endian else '<'
+    os = [ gen_prolog(packed, big_endian) ]
+    widths, formats, zeros = flat_layouts(typeinfo, elaborated)
+    for t_name in elaborated:
+        os += gen_type(typeinfo, elaborated, t_name, endian, widths, formats, zeros)
+
+    os.append('SIZES = {')
+    for t_name in elaborated:
+        os.append(f"    '{t_name}': {t_name}_size,")
+    os.append('}')
+    os.append('')
+    os.append('DECODERS = {')
+    for t_name in elaborated:
+        os.append(f"    '{t_name}': decode_{t_name},")
+    os.append('}')
+    os.append('')
+    os.append('ENCODERS = {')
+    for t_name in elaborated:
+        os.append(f"    '{t_name}': encode_{t_name},")
+    os.append('}')
+    os.append('')
+    return '\n'.join(os)
@@ -1,14 +1,27 @@
 #!/usr/bin/env python3
 
 import argparse
+import array
+import contextlib
+import functools
+import hashlib
 import json
+import mmap
 import random
 import re
 import struct
 import os
-
+import sys
+import threading
+import time
+
+from . import cache
+from . import ndjson
+from . import parallel
+from . import server
 from . import util
 from . import generators
+from . import views
 
 class SchemaValidationError(Exception):
     """Raised when JSON config schema is invalid"""
@@ -20,47 +33,74 @@ class ElaborationError(Exception):
 
 # These are all the basic types that Just Buffers supprts.
 # The rand member is a function used by tests to generate test
-# data.
+# data. np_type is the NumPy type code, without byte order, and
+# array_type is the typecode for an array.array of the type.
+#
+# char is special: the last dimension of a char array is the length of
+# a string, and each such row is decoded to a python str with trailing
+# NULs removed. It has no rand, as values of it are whole strings.
 TYPEINFO = {
-    'bool':   { 'size': 1, 'align': 1, 'pack': 'B', 'c_type': 'bool',
+    'bool':   { 'size': 1, 'align': 1, 'pack': 'B', 'c_type': 'bool', 'np_type': '?', 'array_type': 'B',
                 'rand': lambda: random.choice([True,False])
     },
-    'u8':     { 'size': 1, 'align': 1, 'pack': 'B', 'c_type': 'uint8_t',
+    'u8':     { 'size': 1, 'align': 1, 'pack': 'B', 'c_type': 'uint8_t', 'np_type': 'u1', 'array_type': 'B',
                 'rand': lambda: random.randint(0,255)
     },
-    'i8':     { 'size': 1, 'align': 1, 'pack': 'b', 'c_type': 'int8_t',
+    'i8':     { 'size': 1, 'align': 1, 'pack': 'b', 'c_type': 'int8_t', 'np_type': 'i1', 'array_type': 'b',
                 'rand': lambda: random.randint(-128,127)
     },
-    'u16':    { 'size': 2, 'align': 2, 'pack': 'H', 'c_type': 'uint16_t',
+    'u16':    { 'size': 2, 'align': 2, 'pack': 'H', 'c_type': 'uint16_t', 'np_type': 'u2', 'array_type': 'H',
                 'rand': lambda: random.randint(0,65535)
     },
-    'i16':    { 'size': 2, 'align': 2, 'pack': 'h', 'c_type': 'int16_t',
+    'i16':    { 'size': 2, 'align': 2, 'pack': 'h', 'c_type': 'int16_t', 'np_type': 'i2', 'array_type': 'h',
                 'rand': lambda: random.randint(-32768,32767)
     },
-    'u32':    { 'size': 4, 'align': 4, 'pack': 'L', 'c_type': 'uint32_t',
+    'u32':    { 'size': 4, 'align': 4, 'pack': 'L', 'c_type': 'uint32_t', 'np_type': 'u4', 'array_type': 'I',
                 'rand': lambda: random.randint(0,4294967295)
     },
-    'i32':    { 'size': 4, 'align': 4, 'pack': 'l', 'c_type': 'int32_t',
+    'i32':    { 'size': 4, 'align': 4, 'pack': 'l', 'c_type': 'int32_t', 'np_type': 'i4', 'array_type': 'i',
                 'rand': lambda: random.randint(-2147483648, 2147483647)
     },
-    'u64':    { 'size': 8, 'align': 8, 'pack': 'Q', 'c_type': 'uint64_t',
+    'u64':    { 'size': 8, 'align': 8, 'pack': 'Q', 'c_type': 'uint64_t', 'np_type': 'u8', 'array_type': 'Q',
                 'rand': lambda: random.randint(0,0xffffffff_ffffffff)
     },
-    'i64':    { 'size': 8, 'align': 8, 'pack': 'q', 'c_type': 'int64_t',
+    'i64':    { 'size': 8, 'align': 8, 'pack': 'q', 'c_type': 'int64_t', 'np_type': 'i8', 'array_type': 'q',
                 'rand': lambda: random.randint(0,0xffffffff_ffffffff) - 0x7fffffff_ffffffff
     },
-    'float':  { 'size': 4, 'align': 4, 'pack': 'f', 'c_type': 'float',
+    'float':  { 'size': 4, 'align': 4, 'pack': 'f', 'c_type': 'float', 'np_type': 'f4', 'array_type': 'f',
                 'rand': lambda: struct.unpack('<f', struct.pack('<f', random.uniform(-3.4e38,3.4e38)))[0]
     },
-    'double': { 'size': 8, 'align': 8, 'pack': 'd', 'c_type': 'double',
+    'double': { 'size': 8, 'align': 8, 'pack': 'd', 'c_type': 'double', 'np_type': 'f8', 'array_type': 'd',
                 'rand': lambda: random.uniform(-1.79e308, 1.79e308)
     },
+    'char':   { 'size': 1, 'align': 1, 'pack': 's', 'c_type': 'char', 'np_type': 'S1', 'array_type': None,
+    },
 }
 
+# the methods that enableStats() counts, with whether they encode or
+# decode, and how to tell from what they return how many records they
+# handled
+STATS_METHODS = {
+    'encodeBuffer': ('encode', lambda rv, size: 1),
+    'encodeInto': ('encode', lambda rv, size: 1),
+    'encodeMany': ('encode', lambda rv, size: len(rv) // size),
+    'decodeBuffer': ('decode', lambda rv, size: 1),
+    'decodeInto': ('decode', lambda rv, size: 1),
+    'decodeMany': ('decode', lambda rv, size: len(rv)),
+    'decodeColumns': ('decode', lambda rv, size: len(next(iter(rv.values()))) if rv else 0),
+}
+
+# inputs that encoding takes as a whole base type member at once
+BUFFER_TYPES = (bytes, bytearray, memoryview, array.array)
+
+
 def get_base_types():
     return TYPEINFO
 
 VALID_IDENTIFIER = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+# one component of a field path, such as t0s[*][0]
+FIELD_PATH_PART = re.compile(r'^([a-zA-Z_][a-zA-Z0-9_]*)((?:\[(?:\d+|\*)\])*)$')
+FIELD_PATH_INDEX = re.compile(r'\[(\d+|\*)\]')
 DANGEROUS_PATH_PREFIXES = ['/etc/', '/bin/', '/sbin/', '/usr/bin/', '/usr/sbin/', '/boot/', '/sys/', '/proc/']
 
 C_CPP_KEYWORDS = {
@@ -202,8 +242,26 @@ def validate_config_schema(configs):
         for idx, member in enumerate(members):
             validate_member_schema(type_name, idx, member)
 
+# Codecs are compiled the first time a type is used rather than when the
+# spec is loaded, so that loading a spec with thousands of types costs
+# only their elaboration. Compiling a type compiles the types nested in
+# it, through the same table.
+class CodecTable(dict):
+
+    def __init__(self, compile_codec):
+        super().__init__()
+        self.compile_codec = compile_codec
+
+    def __missing__(self, t_name):
+        codec = self.compile_codec(self, t_name)
+        self[t_name] = codec
+        return codec
+
+
 class JustBufferator():
     typeinfo = TYPEINFO
+    # the instances handed out by shared(), by spec and options
+    shared_bufferators = {}
 
     def __makePlaceholder(self, needed, index, offset):
         return {
@@ -215,6 +273,85 @@ class JustBufferator():
             'size': needed,
         }
 
+    # yields the struct types that the members of t_name are made of
+    def __nestedTypes(self, t_name):
+        for m_info in self.configs[t_name]:
+            if m_info['type'] not in self.typeinfo:
+                yield m_info['type']
+
+    # lays out one type. Every struct type it contains must already be
+    # in elaborated.
+    def __elaborateType(self, t_name, elaborated, messages):
+        offset = 0
+        placeholder_count = 0
+        members = []
+
+        for m_info in self.configs[t_name]:
+            m_name = m_info['name']
+            m_t_name = m_info['type']
+
+            m_elaborated = {
+                'type': m_t_name,
+                'name': m_name,
+            }
+
+            if m_t_name in self.typeinfo:
+                req_align = self.typeinfo[m_t_name]['align']
+                m_t_size = self.typeinfo[m_t_name]['size']
+            else:
+                req_align = elaborated[m_t_name]['align']
+                m_t_size = elaborated[m_t_name]['size']
+
+            if not self.packed:
+                misalignment = offset % req_align
+                if misalignment:
+                    needed_alignment = req_align - misalignment
+                    members.append(self.__makePlaceholder(needed_alignment, placeholder_count, offset))
+                    offset += needed_alignment
+                    placeholder_count += 1
+                    messages.append(('info',f'struct "{t_name}": alignment placeholder size {needed_alignment} inserted before "{m_name}"'))
+
+            m_elaborated['align'] = req_align
+            m_elaborated['offset'] = offset
+            members.append(m_elaborated)
+            counts = m_info.get('counts',[1])
+            if isinstance(counts,int):
+                counts = [counts]
+            m_elaborated['counts'] = counts
+
+            total_count = util.total_array_count(m_elaborated)
+            if total_count > self.max_array_elements:
+                raise ElaborationError(
+                    f"Array too large in type '{t_name}', member '{m_name}': "
+                    f"{total_count} elements exceeds limit of {self.max_array_elements}"
+                )
+
+            total_size = m_t_size * total_count
+            m_elaborated['size'] = total_size
+            offset += total_size
+
+        t_elaborated = {'members': members, 'size': offset}
+        total_req_align = util.powerOfTwoEqualOrMoreThan(offset)
+        if total_req_align > 8:
+            total_req_align = 8
+        t_elaborated['align'] = total_req_align
+
+        if not self.packed:
+            misalignment = offset % total_req_align
+            if misalignment:
+                needed_alignment = total_req_align - misalignment
+                messages.append(('info',f'struct "{t_name}": padding placeholder size {needed_alignment} appended'))
+                members.append(self.__makePlaceholder(needed_alignment, placeholder_count, offset))
+                offset += needed_alignment
+
+        t_elaborated['size'] = offset
+
+        if offset > self.max_struct_size:
+            raise ElaborationError(
+                f"Struct '{t_name}' too large: {offset} bytes exceeds limit of {self.max_struct_size}"
+            )
+        return t_elaborated
+
     def __elaborateConfigs(self):
         elaborated = {}
         messages = []
@@ -234,215 +371,952 @@ class JustBufferator():
                 if m_t_name not in self.typeinfo and m_t_name not in self.configs:
                     raise ElaborationError(f"Unknown type '{m_t_name}' in type '{t_name}', member '{m_name}'")
 
-        # Now elaborate in multiple passes to handle forward references
-        max_passes = len(self.configs) + 1
-        for pass_num in range(max_passes):
-            progress_made = False
-
-            for t_name, t_info in self.configs.items():
-                if t_name in elaborated and 'size' in elaborated[t_name]:
-                    continue  # Already fully elaborated
-
-                can_complete = True
-                offset = 0
-                placeholder_count = 0
-                temp_members = []
-
-                for m_info in t_info:
-                    m_name = m_info['name']
-                    m_t_name = m_info['type']
-
-                    m_elaborated = {
-                        'type': m_t_name,
-                        'name': m_name,
-                    }
-
-                    if m_t_name in self.typeinfo:
-                        req_align = self.typeinfo[m_t_name]['align']
-                        m_t_size = self.typeinfo[m_t_name]['size']
-                    elif m_t_name in elaborated and 'size' in elaborated[m_t_name]:
-                        req_align = elaborated[m_t_name]['align']
-                        m_t_size = elaborated[m_t_name]['size']
-                    else:
-                        # Forward reference - can't complete this type yet
-                        can_complete = False
+        # Now elaborate every type exactly once, after the types it
+        # contains, by walking the graph of type references depth first
+        # (with an explicit stack, so long chains of types can't overflow
+        # python's recursion limit). elaborated ends up in dependency
+        # order, which the codecs and generators rely on.
+        heights = {}
+        visiting = set()
+        for root in self.configs:
+            if root in heights:
+                continue
+            stack = [ (root, self.__nestedTypes(root)) ]
+            visiting.add(root)
+            while stack:
+                t_name, nested = stack[-1]
+                for m_t_name in nested:
+                    if m_t_name in visiting:
+                        path = [ t for t, _ in stack ]
+                        cycle = path[path.index(m_t_name):] + [m_t_name]
+                        raise ElaborationError(f"Circular type reference: {' -> '.join(cycle)}")
+                    if m_t_name not in heights:
+                        visiting.add(m_t_name)
+                        stack.append((m_t_name, self.__nestedTypes(m_t_name)))
                         break
-
-                    if not self.packed:
-                        misalignment = offset % req_align
-                        if misalignment:
-                            needed_alignment = req_align - misalignment
-                            temp_members.append(self.__makePlaceholder(needed_alignment, placeholder_count, offset))
-                            offset += needed_alignment
-                            placeholder_count += 1
-                            messages.append(('info',f'struct "{t_name}": alignment placeholder size {needed_alignment} inserted before "{m_name}"'))
-
-                    m_elaborated['align'] = req_align
-                    m_elaborated['offset'] = offset
-                    temp_members.append(m_elaborated)
-                    counts = m_info.get('counts',[1])
-                    if isinstance(counts,int):
-                        counts = [counts]
-                    m_elaborated['counts'] = counts
-
-                    total_count = util.total_array_count(m_elaborated)
-                    if total_count > self.max_array_elements:
+                else:
+                    stack.pop()
+                    visiting.discard(t_name)
+                    elaborated[t_name] = self.__elaborateType(t_name, elaborated, messages)
+                    # number of levels of structs nested inside t_name,
+                    # computed once per type from those of its members
+                    heights[t_name] = max(
+                        [ heights[m_t_name] + 1 for m_t_name in set(self.__nestedTypes(t_name)) ],
+                        default=0
+                    )
+                    if heights[t_name] > self.max_nesting_depth:
                         raise ElaborationError(
-                            f"Array too large in type '{t_name}', member '{m_name}': "
-                            f"{total_count} elements exceeds limit of {self.max_array_elements}"
+                            f"Nesting depth {heights[t_name]} in type '{t_name}' exceeds limit of {self.max_nesting_depth}"
                         )
 
-                    total_size = m_t_size * total_count
-                    m_elaborated['size'] = total_size
-                    offset += total_size
-
-                if not can_complete:
-                    continue  # Skip this type for now, try again in next pass
-
-                # Type can be completed
-                elaborated[t_name] = {'members': temp_members}
-                elaborated[t_name]['size'] = offset
-                total_req_align = util.powerOfTwoEqualOrMoreThan(offset)
-                if total_req_align > 8:
-                    total_req_align = 8
-                elaborated[t_name]['align'] = total_req_align
-
-                if not self.packed:
-                    misalignment = offset % total_req_align
-                    if misalignment:
-                        needed_alignment = total_req_align - misalignment
-                        messages.append(('info',f'struct "{t_name}": padding placeholder size {needed_alignment} appended'))
-                        elaborated[t_name]['members'].append(self.__makePlaceholder(needed_alignment, placeholder_count, offset))
-                        offset += needed_alignment
-
-                elaborated[t_name]['size'] = offset
-
-                if offset > self.max_struct_size:
-                    raise ElaborationError(
-                        f"Struct '{t_name}' too large: {offset} bytes exceeds limit of {self.max_struct_size}"
-                    )
-
-                progress_made = True
-
-            if not progress_made:
-                # No progress in this pass - must be circular references
-                break
-
-        def validate_depth(t_name, depth=0):
-            if t_name in self.typeinfo:
-                return depth
-
-            if depth > self.max_nesting_depth:
-                raise ElaborationError(
-                    f"Nesting depth {depth} in type '{t_name}' exceeds limit of {self.max_nesting_depth}"
-                )
-
-            max_depth = depth
-            for m_info in elaborated[t_name]['members']:
-                m_type = m_info['type']
-                if m_type not in self.typeinfo:
-                    d = validate_depth(m_type, depth + 1)
-                    max_depth = max(max_depth, d)
-
-            return max_depth
-
-        for t_name in elaborated:
-            validate_depth(t_name)
-
         self.elab_messages = messages
         self.elaborated = elaborated
                     
 
-    def encodeBuffer(self, t_name, data):
-        enc_messages = [] 
-        def encodeMember(m_info, values):
+    # Flattens the elaborated layout of a type into a single
+    # struct.Struct, so that a whole record can be packed or unpacked
+    # in one call. Nested types are inlined and alignment placeholders
+    # stay ordinary u8 members.
+    #
+    # Most base type arrays take one flat value per element. Some are
+    # packed a row (the last dimension) at a time instead, as one 's'
+    # value, so their elements are never boxed one by one: char arrays
+    # always are, as strings, and with compact=True so are all other
+    # arrays except bool ones.
+    #
+    # Each member of a codec is a tuple of:
+    #   (name, type, kind, n_values, shape, sub_codec, zeros, row)
+    # where kind is one of the KIND_ constants, n_values is the number of
+    # flat values the member occupies, shape is the array shape of those
+    # values (empty for a lone scalar or row), sub_codec is the codec of a
+    # nested type and row describes a row for the row kinds.
+    #
+    # The codec's 'zeros' are the flat values of an all-zero record, for
+    # members missing from the data being encoded.
+    #
+    # The codec also has a 'fields' dict for random access to single
+    # members, mapping each member name to a tuple of:
+    #   (type, offset, counts, element_size, element_struct)
+    # where element_struct packs one element of a base type, and is None
+    # for nested types. For char members the element is a whole string,
+    # and counts leave out the string length.
+    KIND_VALUE  = 0
+    KIND_BOOL   = 1
+    KIND_STRUCT = 2
+    KIND_STR    = 3
+    KIND_BYTES  = 4
+    KIND_ARRAY  = 5
+
+    def __compileCodec(self, compact, codecs, t_name):
+        swap = self.swap_bytes
+        t_info = self.elaborated[t_name]
+        fmt = []
+        members = []
+        fields = {}
+        n_values = 0
+        t_zeros = []
+        for m_info in t_info['members']:
             m_type = m_info['type']
-            m_t_info = self.typeinfo.get(m_type, None)
-            flat_values = util.flattenArrays(values)
+            counts = m_info['counts']
             total_count = util.total_array_count(m_info)
-
-            if m_t_info is not None:
-                fmt = m_t_info['pack']
-                if len(flat_values) < total_count:
-                    enc_messages.append(('warning', f'input for {m_info["name"]} too short'))
-                    flat_values += [0] * (total_count - len(flat_values))
-                obytes = struct.pack(f'{self.pack_endian}{total_count}{fmt}', *flat_values)     
+            sub_codec = None
+            row = None
+            elem_struct = self.elem_structs.get(m_type)
+            elem_counts = counts
+            if m_type not in self.typeinfo:
+                kind = self.KIND_STRUCT
+                sub_codec = codecs[m_type]
+                fmt.append(sub_codec['fmt'] * total_count)
+                m_n_values = total_count * sub_codec['n_values']
+                shape = [] if util.is_scalar(m_info) and len(counts) == 1 else counts
+                zeros = sub_codec['zeros'] * total_count
+            elif m_type == 'char' or (compact and m_type != 'bool' and not util.is_scalar(m_info)):
+                b_info = self.typeinfo[m_type]
+                row_len = counts[-1]
+                row_size = row_len * b_info['size']
+                if m_type == 'char':
+                    kind = self.KIND_STR
+                    elem_struct = struct.Struct(f'{self.pack_endian}{row_len}s')
+                    elem_counts = counts[:-1] or [1]
+                elif b_info['size'] == 1:
+                    kind = self.KIND_BYTES
+                else:
+                    kind = self.KIND_ARRAY
+                row = (
+                    row_len, row_size, b_info['array_type'], swap,
+                    struct.Struct(f'{self.pack_endian}{row_len}{b_info["pack"]}'),
+                )
+                m_n_values = total_count // row_len
+                fmt.append(f'{row_size}s' * m_n_values)
+                shape = counts[:-1]
+                zeros = [b''] * m_n_values
             else:
-                m_t_info = self.elaborated[m_type]
-                if len(flat_values) < total_count:
-                    flat_values += [{}] * (total_count - len(flat_values))
-                obytes = b''.join([ self.encodeBuffer(m_type, v) for v in flat_values])
-                
-            return obytes
+                kind = self.KIND_BOOL if m_type == 'bool' else self.KIND_VALUE
+                fmt.append(f'{total_count}{self.typeinfo[m_type]["pack"]}')
+                m_n_values = total_count
+                shape = [] if util.is_scalar(m_info) and len(counts) == 1 else counts
+                zeros = [0] * m_n_values
+
+            members.append((
+                m_info['name'], m_type, kind, m_n_values, shape, sub_codec, zeros, row
+            ))
+            fields[m_info['name']] = (
+                m_type, m_info['offset'], elem_counts,
+                m_info['size'] // util.total_array_count({'counts': elem_counts}), elem_struct
+            )
+            n_values += m_n_values
+            t_zeros += zeros
+
+        codec = {
+            'fmt': ''.join(fmt),
+            'members': members,
+            'fields': fields,
+            'n_values': n_values,
+            'zeros': t_zeros,
+        }
+        codec['struct'] = struct.Struct(self.pack_endian + codec['fmt'])
+        if codec['struct'].size != t_info['size']:
+            raise ElaborationError(
+                f"Struct '{t_name}' compiled to {codec['struct'].size} bytes "
+                f"but elaborated to {t_info['size']}; this is a bug"
+            )
+        return codec
+
+    # Compiles a projection of t_name: the plan decodeBuffer(...,
+    # fields=...) follows to decode only those fields. Each field is
+    # resolved to the parts of the record it covers, and those parts
+    # become the members of a codec of their own, whose format skips the
+    # bytes in between with pad codes. So the projected decode is one
+    # unpack_from of just the bytes wanted, and __buildValues as usual.
+    # Parts that overlap (a struct and one of its members, say) can't
+    # share a format, so they go in a further layer with its own codec.
+    #
+    # Returns (layers, shapes, picks): layers is a list of (struct,
+    # codec), and shapes has, for every field, the key of its part in the
+    # decoded values, or nested lists of them for fields with [*]. When
+    # every field is a single number, which is the usual case, there is
+    # one layer and nothing to build; picks then has, for every field,
+    # the index of its value in what the layer unpacks.
+    def __compileProjection(self, t_name, fields):
+        parts = {}
+        shapes = [ self.__resolveField(t_name, field, parts) for field in fields ]
+
+        layers = []
+        for offset, size, fmt, member in sorted(parts.values(), key=lambda p: p[0]):
+            for layer in layers:
+                if layer['end'] <= offset:
+                    break
+            else:
+                layer = { 'end': 0, 'fmt': [], 'members': [] }
+                layers.append(layer)
+            if offset > layer['end']:
+                layer['fmt'].append(f'{offset - layer["end"]}x')
+            layer['fmt'].append(fmt)
+            layer['members'].append(member)
+            layer['end'] = offset + size
+
+        compiled = []
+        for layer in layers:
+            codec = { 'fmt': ''.join(layer['fmt']), 'members': layer['members'] }
+            compiled.append((struct.Struct(self.pack_endian + codec['fmt']), codec))
+
+        picks = None
+        if len(layers) == 1 and all(m[2] == self.KIND_VALUE and not m[4] for m in layers[0]['members']):
+            position = { m[0]: i for i, m in enumerate(layers[0]['members']) }
+            if all(isinstance(shape, str) for shape in shapes):
+                picks = [ (field, position[shape]) for field, shape in zip(fields, shapes) ]
+        return compiled, shapes, picks
+
+    # Resolves one field path of t_name, such as 'hdr.seq' or
+    # 't0s[*][0].fee', adding the parts of the record it covers to parts.
+    # A path can stop at any member, or part way into the indices of an
+    # array, to take a whole struct or subarray.
+    def __resolveField(self, t_name, field, parts):
+        names = field.split('.')
+
+        def resolve(t_name, base, k, prefix):
+            match = FIELD_PATH_PART.match(names[k])
+            if match is None:
+                raise ValueError(f'bad field path "{field}": can\'t make sense of "{names[k]}"')
+            name, index_str = match.groups()
+            codec = self.codecs[t_name]
+            if name not in codec['fields']:
+                raise ValueError(f'bad field path "{field}": "{t_name}" has no member "{name}"')
+            member = next(m for m in codec['members'] if m[0] == name)
+            kind, shape = member[2], member[4]
+            _, m_offset, dims, elem_size, _ = codec['fields'][name]
+            if not shape and kind not in (self.KIND_BYTES, self.KIND_ARRAY):
+                dims = []
+            indices = FIELD_PATH_INDEX.findall(index_str)
+            if len(indices) > len(dims):
+                raise ValueError(
+                    f'bad field path "{field}": "{name}" takes at most {len(dims)} indices'
+                )
+            more = k + 1 < len(names)
+            if more and (kind != self.KIND_STRUCT or len(indices) < len(dims)):
+                raise ValueError(f'bad field path "{field}": "{name}" is not a single struct')
+
+            def expand(level, offset, path):
+                if level == len(indices):
+                    if more:
+                        return resolve(member[1], offset, k + 1, path + '.')
+                    return self.__projectPart(member, elem_size, dims[level:], offset, path, parts)
+                stride = elem_size * util.total_array_count({ 'counts': dims[level + 1:] + [1] })
+                if indices[level] == '*':
+                    return [
+                        expand(level + 1, offset + i * stride, f'{path}[{i}]')
+                        for i in range(dims[level])
+                    ]
+                i = int(indices[level])
+                if i >= dims[level]:
+                    raise ValueError(
+                        f'bad field path "{field}": index {i} is out of range for "{name}"'
+                    )
+                return expand(level + 1, offset + i * stride, f'{path}[{i}]')
+
+            return expand(0, base + m_offset, prefix + name)
+
+        return resolve(t_name, 0, 0, '')
+
+    # Adds the part of a projection at offset: the elements of member
+    # left by the remaining dims, which is all of them when no index was
+    # given and one when every index was. The part is keyed by its path.
+    def __projectPart(self, member, elem_size, dims, offset, path, parts):
+        m_name, m_type, kind, n_values, shape, sub_codec, zeros, row = member
+        count = util.total_array_count({ 'counts': dims + [1] })
+        if kind == self.KIND_STRUCT:
+            fmt = sub_codec['fmt'] * count
+            n_values = count * sub_codec['n_values']
+        elif kind in (self.KIND_BYTES, self.KIND_ARRAY) and not dims:
+            # one element from within a row
+            kind = self.KIND_VALUE
+            fmt = self.typeinfo[m_type]['pack']
+            n_values = 1
+            row = None
+        elif kind in (self.KIND_BYTES, self.KIND_ARRAY):
+            n_values = count // dims[-1]
+            fmt = f'{row[1]}s' * n_values
+            dims = dims[:-1]
+        elif kind == self.KIND_STR:
+            fmt = f'{row[1]}s' * count
+            n_values = count
+        else:
+            fmt = f'{count}{self.typeinfo[m_type]["pack"]}'
+            n_values = count
+        parts[path] = (
+            offset, elem_size * count, fmt, (path, m_type, kind, n_values, dims, sub_codec, None, row)
+        )
+        return path
+
+    # turns one row of input (a str, a bytes-like object, an array.array
+    # or a list of numbers) into the bytes that a row kind packs
+    def __packRow(self, kind, row, value, m_name, enc_messages):
+        row_len, row_size, typecode, swap, row_struct = row
+        if kind == self.KIND_STR and isinstance(value, str):
+            value = util.encodeString(value)
+        elif isinstance(value, array.array):
+            if swap:
+                value = array.array(value.typecode, value)
+                value.byteswap()
+            value = value.tobytes()
+        elif isinstance(value, (list, tuple)):
+            if len(value) > row_len:
+                raise struct.error(
+                    f'too many values for {m_name}: expected {row_len}, got {len(value)}'
+                )
+            if len(value) < row_len:
+                enc_messages.append(('warning', f'input for {m_name} too short'))
+                value = list(value) + [0] * (row_len - len(value))
+            return row_struct.pack(*value)
+
+        value = bytes(value)
+        if len(value) > row_size:
+            raise struct.error(
+                f'too many bytes for {m_name}: expected at most {row_size}, got {len(value)}'
+            )
+        # struct pads short 's' values with zeros itself
+        return value
+
+    # Base type members can also be given as a single buffer holding the
+    # whole member, whatever its shape. bytes, bytearray and memoryview
+    # input is the member as encoded (in the bufferator's byte order);
+    # array.array input is the member's values. Returns the flat values
+    # the member's kind packs, without building a list of python numbers
+    # where it can avoid it.
+    def __bufferValues(self, m_name, kind, m_type, n_values, row, value):
+        b_info = self.typeinfo[m_type]
+        if kind >= self.KIND_STR:
+            if isinstance(value, array.array):
+                if self.swap_bytes:
+                    value = array.array(value.typecode, value)
+                    value.byteswap()
+                value = value.tobytes()
+            row_size = row[1]
+            raw = memoryview(value).cast('B')
+            if raw.nbytes > n_values * row_size:
+                raise struct.error(
+                    f'too many bytes for {m_name}: expected at most {n_values * row_size}, got {raw.nbytes}'
+                )
+            return [ raw[k:k + row_size] for k in range(0, raw.nbytes, row_size) ]
+
+        if isinstance(value, array.array):
+            return value
+        raw = memoryview(value).cast('B')
+        if b_info['size'] == 1:
+            return raw.cast('b') if b_info['pack'] == 'b' else raw
+        if raw.nbytes % b_info['size']:
+            raise struct.error(
+                f'{raw.nbytes} bytes for {m_name} is not a whole number of {m_type} values'
+            )
+        return util.makeArray(b_info['array_type'], raw, self.swap_bytes)
 
-        t_info = self.elaborated[t_name]
-        odata = []
-        for m_info in t_info['members']:
-            m_name = m_info['name']
+    def __flattenValues(self, codec, data, ovalues, enc_messages):
+        for m_name, m_type, kind, n_values, shape, sub_codec, zeros, row in codec['members']:
             values = data.get(m_name)
             if values is None:
-                odata.append(bytes(m_info['size']))
+                ovalues.extend(zeros)
+                continue
+
+            if kind != self.KIND_STRUCT and isinstance(values, BUFFER_TYPES) and (
+                    kind != self.KIND_STR or shape):
+                flat_values = self.__bufferValues(m_name, kind, m_type, n_values, row, values)
+            elif kind >= self.KIND_STR:
+                flat_values = util.flattenLevels(values, len(shape))
+                if kind != self.KIND_STR and flat_values and isinstance(flat_values[0], (int, float)):
+                    # all of the member's numbers in one flat list
+                    flat_values = util.flattenArrays(values)
+                    flat_values = [
+                        flat_values[k:k + row[0]] for k in range(0, len(flat_values), row[0])
+                    ]
             else:
-                odata.append(encodeMember(m_info, values))
-        self.enc_messages = enc_messages
+                flat_values = util.flattenArrays(values)
+            total_count = n_values if sub_codec is None else n_values // sub_codec['n_values']
+            if len(flat_values) > total_count:
+                raise struct.error(
+                    f'too many values for {m_name}: expected {total_count}, got {len(flat_values)}'
+                )
 
-        return b''.join(odata)
-         
-    def decodeBuffer(self, t_name, data):
+            if kind == self.KIND_STRUCT:
+                for v in flat_values:
+                    self.__flattenValues(sub_codec, v, ovalues, enc_messages)
+                if len(flat_values) < total_count:
+                    ovalues.extend(zeros[len(flat_values) * sub_codec['n_values']:])
+                continue
 
-        def decodeMember(m_info, data):
-            m_type = m_info['type']
-            m_t_info = self.typeinfo.get(m_type, None)
-            total_count = util.total_array_count(m_info)
-            d_ary = []
-            if m_t_info is not None:
-                total_size = total_count * m_t_info['size']
-                fmt = m_t_info['pack']
-                d_ary = list(struct.unpack(f'{self.pack_endian}{total_count}{fmt}', data[:total_size]))
-                if m_type == 'bool':
-                    d_ary = [ bool(x) for x in d_ary ]
-                # print(m_info['name'], m_info['type'], d_ary)
+            if kind >= self.KIND_STR:
+                ovalues.extend([ self.__packRow(kind, row, v, m_name, enc_messages) for v in flat_values ])
             else:
-                m_t_info = self.elaborated[m_type]
-                total_size = total_count * m_t_info['size']
-                d_ary = []
-                for i in range(total_count):
-                    subdata = data[i*m_t_info['size']:(i+1)*m_t_info['size']]
-                    # print('i', i, subdata.hex())
-                    d_ary.append(self.decodeBuffer(m_info['type'], subdata))
-            return d_ary
-                
-        t_info = self.elaborated[t_name]
+                ovalues.extend(flat_values)
+            if len(flat_values) < total_count:
+                enc_messages.append(('warning', f'input for {m_name} too short'))
+                ovalues.extend(zeros[len(flat_values):])
+
+    def __buildValues(self, codec, values, i):
         rv = {}
-        offset = 0
-        for m_info in t_info['members']:
-            raw_array = decodeMember(m_info, data[offset:offset+m_info['size']])
-            rv[m_info['name']] = util.unflattenArray(raw_array, m_info['counts'])
-            offset += m_info['size']
+        for m_name, m_type, kind, n_values, shape, sub_codec, zeros, row in codec['members']:
+            if kind == self.KIND_STRUCT:
+                d_ary = []
+                for _ in range(n_values // sub_codec['n_values']):
+                    v, i = self.__buildValues(sub_codec, values, i)
+                    d_ary.append(v)
+            else:
+                if n_values == 1:
+                    d_ary = [values[i]]
+                else:
+                    d_ary = list(values[i:i+n_values])
+                i += n_values
+                if kind == self.KIND_BOOL:
+                    d_ary = [ bool(x) for x in d_ary ]
+                elif kind == self.KIND_STR:
+                    d_ary = [ util.decodeString(x) for x in d_ary ]
+                elif kind == self.KIND_ARRAY:
+                    d_ary = [ util.makeArray(row[2], x, row[3]) for x in d_ary ]
+
+            if not shape:
+                rv[m_name] = d_ary[0]
+            elif len(shape) == 1:
+                rv[m_name] = d_ary
+            else:
+                rv[m_name] = util.unflattenArray(d_ary, shape)
+        return rv, i
+
+    # Like __buildValues, but overwrites the values of target (a
+    # previously decoded record of the same type) in place. Dicts, lists
+    # and array.array rows that already have the right shape are reused;
+    # anything else is replaced with a freshly built value.
+    def __fillValues(self, codec, values, i, target):
+        for m_name, m_type, kind, n_values, shape, sub_codec, zeros, row in codec['members']:
+            if shape:
+                target[m_name], i = self.__fillLevel(kind, sub_codec, row, shape, values, i, target.get(m_name))
+            else:
+                target[m_name], i = self.__fillElement(kind, sub_codec, row, values, i, target.get(m_name))
+        return i
+
+    def __fillElement(self, kind, sub_codec, row, values, i, current):
+        if kind == self.KIND_STRUCT:
+            if isinstance(current, dict):
+                return current, self.__fillValues(sub_codec, values, i, current)
+            return self.__buildValues(sub_codec, values, i)
+        v = values[i]
+        if kind == self.KIND_BOOL:
+            v = bool(v)
+        elif kind == self.KIND_STR:
+            v = util.decodeString(v)
+        elif kind == self.KIND_ARRAY:
+            if isinstance(current, array.array) and current.typecode == row[2] and len(current) == row[0]:
+                memoryview(current).cast('B')[:] = v
+                if row[3]:
+                    current.byteswap()
+                return current, i + 1
+            v = util.makeArray(row[2], v, row[3])
+        return v, i + 1
+
+    def __fillLevel(self, kind, sub_codec, row, shape, values, i, current):
+        n = shape[0]
+        if not (isinstance(current, list) and len(current) == n):
+            current = [None] * n
+        if len(shape) > 1:
+            for k in range(n):
+                current[k], i = self.__fillLevel(kind, sub_codec, row, shape[1:], values, i, current[k])
+        elif kind == self.KIND_VALUE:
+            current[:] = values[i:i + n]
+            i += n
+        elif kind == self.KIND_BOOL:
+            current[:] = map(bool, values[i:i + n])
+            i += n
+        else:
+            for k in range(n):
+                current[k], i = self.__fillElement(kind, sub_codec, row, values, i, current[k])
+        return current, i
+
+    # enc_messages holds the messages of the latest encode by any thread.
+    # Each thread's own latest are also kept apart, for the stats, which
+    # another thread's encode mustn't change between the call and the
+    # counting.
+    def __setMessages(self, enc_messages):
+        self.enc_messages = enc_messages
+        self.thread_state.enc_messages = enc_messages
+
+    def encodeBuffer(self, t_name, data):
+        codec = self.codecs[t_name]
+        enc_messages = []
+        ovalues = []
+        self.__flattenValues(codec, data, ovalues, enc_messages)
+        self.__setMessages(enc_messages)
+        return codec['struct'].pack(*ovalues)
+
+    # Encodes data straight into buffer (a bytearray, writable mmap,
+    # shared memory, or a writable memoryview of any of those) starting
+    # at offset, with a single pack_into. Members missing from data are
+    # written as zeros; nothing outside the record is touched. Returns
+    # the number of bytes written.
+    def encodeInto(self, t_name, data, buffer, offset=0):
+        codec = self.codecs[t_name]
+        enc_messages = []
+        ovalues = []
+        self.__flattenValues(codec, data, ovalues, enc_messages)
+        self.__setMessages(enc_messages)
+        codec['struct'].pack_into(buffer, offset, *ovalues)
+        return codec['struct'].size
+
+    # data can be any object supporting the buffer protocol (bytes,
+    # bytearray, mmap, memoryview, ...). The record is read in place
+    # starting at offset; no part of data is copied or sliced.
+    #
+    # With fields, a list of paths like 'hdr.seq' or 't0s[*][0].fee',
+    # only those fields are unpacked, and the result maps each path to
+    # its value. A [*] index takes every element of that dimension, and
+    # makes the value a list of them. Paths can also stop at a struct or
+    # an array, to take all of it. The plan for each list of fields is
+    # compiled on first use and kept, so later decodes of the same fields
+    # cost only the unpacking.
+    def decodeBuffer(self, t_name, data, offset=0, fields=None):
+        if fields is not None:
+            return self.__decodeProjection(t_name, data, offset, fields)
+        codec = self.codecs[t_name]
+        rv, _ = self.__buildValues(codec, codec['struct'].unpack_from(data, offset), 0)
         return rv
 
+    def __decodeProjection(self, t_name, data, offset, fields):
+        key = (t_name, tuple(fields))
+        projection = self.projections.get(key)
+        if projection is None:
+            projection = self.projections[key] = self.__compileProjection(t_name, key[1])
+        layers, shapes, picks = projection
+        if picks is not None:
+            unpacked = layers[0][0].unpack_from(data, offset)
+            return { field: unpacked[i] for field, i in picks }
+
+        values = {}
+        for layer_struct, layer_codec in layers:
+            values.update(self.__buildValues(layer_codec, layer_struct.unpack_from(data, offset), 0)[0])
+
+        def place(shape):
+            if isinstance(shape, str):
+                return values[shape]
+            return [ place(s) for s in shape ]
+
+        return { field: place(shape) for field, shape in zip(key[1], shapes) }
+
+    # Decodes the record at offset into target, a record of the same
+    # type decoded earlier, and returns target. Its dicts and lists are
+    # overwritten in place rather than replaced wherever their shape
+    # still matches, so a consumer that keeps decoding into the same
+    # target allocates little more than the unpacked values themselves.
+    # Members of target the type doesn't have are left alone.
+    def decodeInto(self, t_name, data, target, offset=0):
+        codec = self.codecs[t_name]
+        self.__fillValues(codec, codec['struct'].unpack_from(data, offset), 0, target)
+        return target
+
+    # Encodes every item of values as one record and returns all of
+    # them concatenated.
+    def encodeMany(self, t_name, values):
+        codec = self.codecs[t_name]
+        pack = codec['struct'].pack
+        enc_messages = []
+        orecords = []
+        for data in values:
+            ovalues = []
+            self.__flattenValues(codec, data, ovalues, enc_messages)
+            orecords.append(pack(*ovalues))
+        self.__setMessages(enc_messages)
+        return b''.join(orecords)
+
+    # Decodes count consecutive records starting at offset. If count is
+    # None, decodes as many whole records as data holds; trailing bytes
+    # that don't make up a whole record are ignored, just as decodeBuffer
+    # ignores bytes past the end of a single record.
+    def decodeMany(self, t_name, data, count=None, offset=0):
+        codec = self.codecs[t_name]
+        size = codec['struct'].size
+        with memoryview(data) as mv, mv.cast('B') as raw:
+            available = (raw.nbytes - offset) // size
+            if count is None:
+                count = available
+            elif count > available:
+                raise struct.error(
+                    f'decodeMany of {count} records of {t_name} requires {count * size} bytes '
+                    f'at offset {offset}, but only {raw.nbytes - offset} are available'
+                )
+            build = self.__buildValues
+            return [
+                build(codec, values, 0)[0]
+                for values in codec['struct'].iter_unpack(raw[offset:offset + count * size])
+            ]
+
+    # Returns the path of every leaf value of t_name, along with its base
+    # type, in the order the values appear in the record (which is also
+    # the order of the flat values of leaf_codecs). Paths look like
+    # 't0s[1][0].fee' or 't0s[1][0].fum[5]'. A leaf of a char array is a
+    # whole string, so its path leaves out the last index.
+    def leafPaths(self, t_name):
+        if t_name not in self.leaf_paths:
+            leaves = []
+            for m_info in self.elaborated[t_name]['members']:
+                m_type = m_info['type']
+                counts = m_info['counts'][:-1] if m_type == 'char' else m_info['counts']
+                for suffix in util.indexSuffixes(counts):
+                    path = m_info['name'] + suffix
+                    if m_type in self.typeinfo:
+                        leaves.append((path, m_type))
+                    else:
+                        leaves += [ (f'{path}.{l_path}', l_type) for l_path, l_type in self.leafPaths(m_type) ]
+            self.leaf_paths[t_name] = leaves
+        return self.leaf_paths[t_name]
+
+    # Returns the index of every leaf of t_name: a dict mapping each path
+    # leafPaths gives to (offset, base type, element struct), where the
+    # offset is from the start of the record and the element struct
+    # unpacks the leaf (a whole string, for char leaves). Built the first
+    # time it is asked for, and kept.
+    def leafIndex(self, t_name):
+        index = self.leaf_indexes.get(t_name)
+        if index is None:
+            index = {}
+            fields = self.codecs[t_name]['fields']
+            for m_info in self.elaborated[t_name]['members']:
+                m_name = m_info['name']
+                m_type, m_offset, _, elem_size, elem_struct = fields[m_name]
+                counts = m_info['counts'][:-1] if m_type == 'char' else m_info['counts']
+                for i, suffix in enumerate(util.indexSuffixes(counts)):
+                    path = m_name + suffix
+                    offset = m_offset + i * elem_size
+                    if elem_struct is not None:
+                        index[path] = (offset, m_type, elem_struct)
+                    else:
+                        for l_path, (l_offset, l_type, l_struct) in self.leafIndex(m_type).items():
+                            index[f'{path}.{l_path}'] = (offset + l_offset, l_type, l_struct)
+            self.leaf_indexes[t_name] = index
+        return index
+
+    # Reads the single leaf at path (as leafPaths names them, such as
+    # 't0s[1][0].fee') of the record of t_name at offset in buffer, with
+    # one unpack_from.
+    def getField(self, t_name, buffer, path, offset=0):
+        index = self.leafIndex(t_name)
+        if path not in index:
+            raise KeyError(f'"{t_name}" has no leaf "{path}"')
+        l_offset, l_type, l_struct = index[path]
+        return views._element(self, l_type, l_struct, buffer, offset + l_offset)
+
+    # Writes the single leaf at path of the record of t_name at offset in
+    # buffer, which must be writable, with one pack_into.
+    def setField(self, t_name, buffer, path, value, offset=0):
+        index = self.leafIndex(t_name)
+        if path not in index:
+            raise KeyError(f'"{t_name}" has no leaf "{path}"')
+        l_offset, l_type, l_struct = index[path]
+        views._setElement(self, l_type, l_struct, buffer, offset + l_offset, value)
+
+    # Decodes count consecutive records (all of them, if count is None)
+    # into columns rather than rows: a dict mapping every leaf path (see
+    # leafPaths) to an array.array holding that value for each record, or
+    # a list of str for char leaves. Records are unpacked a chunk at a
+    # time, so the temporary python objects never outnumber
+    # chunk_records records' worth of values.
+    def decodeColumns(self, t_name, data, count=None, offset=0, chunk_records=4096):
+        codec = self.leaf_codecs[t_name]
+        size = codec['struct'].size
+        leaves = self.leafPaths(t_name)
+        columns = [
+            [] if l_type == 'char' else array.array(self.typeinfo[l_type]['array_type'])
+            for _, l_type in leaves
+        ]
+        with memoryview(data) as mv, mv.cast('B') as raw:
+            available = (raw.nbytes - offset) // size
+            if count is None:
+                count = available
+            elif count > available:
+                raise struct.error(
+                    f'decodeColumns of {count} records of {t_name} requires {count * size} bytes '
+                    f'at offset {offset}, but only {raw.nbytes - offset} are available'
+                )
+            for start in range(0, count, chunk_records):
+                n = min(chunk_records, count - start)
+                chunk_offset = offset + start * size
+                rows = codec['struct'].iter_unpack(raw[chunk_offset:chunk_offset + n * size])
+                for column, values in zip(columns, zip(*rows)):
+                    if isinstance(column, list):
+                        values = [ util.decodeString(v) for v in values ]
+                    column.extend(values)
+        return { path: column for (path, _), column in zip(leaves, columns) }
+
+    # Returns a lazy view of the record of type t_name at offset in data.
+    # Members are decoded only when accessed; see views.py.
+    def view(self, t_name, data, offset=0):
+        size = self.elaborated[t_name]['size']
+        with memoryview(data) as mv:
+            if mv.nbytes < offset + size:
+                raise struct.error(
+                    f'view of {t_name} requires a buffer of at least {offset + size} bytes, '
+                    f'got {mv.nbytes}'
+                )
+        return views.StructView(self, t_name, data, offset)
+
+    # Returns a NumPy structured dtype with the same layout as t_name:
+    # same member names, offsets, array shapes, nested types, byte order
+    # and total size, so np.frombuffer() or np.memmap() can decode whole
+    # arrays of records with no per-record python work. NumPy is only
+    # imported when this is called.
+    def numpyDtype(self, t_name):
+        import numpy
+
+        made = {}
+        def make(t_name):
+            if t_name in made:
+                return made[t_name]
+            t_info = self.elaborated[t_name]
+            formats = []
+            for m_info in t_info['members']:
+                m_type = m_info['type']
+                counts = m_info['counts']
+                if m_type == 'char':
+                    fmt = numpy.dtype(f'S{counts[-1]}')
+                    counts = counts[:-1] or [1]
+                elif m_type in self.typeinfo:
+                    fmt = numpy.dtype(self.pack_endian + self.typeinfo[m_type]['np_type'])
+                else:
+                    fmt = make(m_type)
+                if len(counts) == 1 and counts[0] == 1:
+                    formats.append(fmt)
+                else:
+                    formats.append((fmt, tuple(counts)))
+            made[t_name] = numpy.dtype({
+                'names': [ m_info['name'] for m_info in t_info['members'] ],
+                'formats': formats,
+                'offsets': [ m_info['offset'] for m_info in t_info['members'] ],
+                'itemsize': t_info['size'],
+            })
+            return made[t_name]
+
+        return make(t_name)
+
+    # Everything that determines how t_name is laid out in memory but
+    # byte order, as compact JSON: member names, base types, offsets,
+    # sizes, array shapes and nested layouts.
+    def __layoutDescription(self, t_name):
+        described = {}
+        def describe(t_name):
+            if t_name in described:
+                return described[t_name]
+            t_info = self.elaborated[t_name]
+            described[t_name] = [t_info['size'], t_info['align'], [
+                [
+                    m_info['name'],
+                    m_info['type'] if m_info['type'] in self.typeinfo else describe(m_info['type']),
+                    m_info['offset'],
+                    m_info['size'],
+                    m_info['counts'],
+                ]
+                for m_info in t_info['members']
+            ]]
+            return described[t_name]
+
+        if t_name not in self.layouts:
+            self.layouts[t_name] = json.dumps(describe(t_name), separators=(',', ':'))
+        return self.layouts[t_name]
+
+    # A short hash of the layout of t_name and its byte order. Two
+    # bufferators agree on the fingerprint of a type exactly when they
+    # encode it identically.
+    def layoutFingerprint(self, t_name):
+        if t_name not in self.fingerprints:
+            layout = f'[{json.dumps(self.pack_endian)},{self.__layoutDescription(t_name)}]'
+            self.fingerprints[t_name] = hashlib.sha256(layout.encode('utf-8')).digest()[:8]
+        return self.fingerprints[t_name]
+
+    # The 32-bit id that frames of t_name carry (see framing.py), taken
+    # from a hash of its name and layout. Byte order is left out, so the
+    # C and C++ headers, whose records are in the host's byte order, get
+    # the same ids whatever big_endian is; frames carry their byte order
+    # in a flag instead.
+    def typeId(self, t_name):
+        digest = hashlib.sha256((t_name + self.__layoutDescription(t_name)).encode('utf-8')).digest()
+        return int.from_bytes(digest[:4], 'little')
+
+    # Instrumentation. While stats are enabled, every encode and decode
+    # call is counted against its type: calls, records, bytes encoded or
+    # decoded, total and longest time per call, and the messages encodes
+    # produce. The counting wrappers are installed on the instance only
+    # while enabled, so a bufferator that doesn't use them pays nothing.
+    #
+    # hook, if given, is called after every counted call as
+    #   hook(method_name, t_name, records, nbytes, seconds)
+    # from whatever thread made the call.
+    def enableStats(self, hook=None):
+        self.disableStats()
+        self.stats_hook = hook
+        for m_name, (direction, count_records) in STATS_METHODS.items():
+            setattr(self, m_name, self.__countCalls(getattr(self, m_name), direction, count_records))
+
+    def disableStats(self):
+        for m_name in STATS_METHODS:
+            self.__dict__.pop(m_name, None)
+        self.stats_hook = None
+
+    def resetStats(self):
+        with self.stats_lock:
+            self.type_stats = {}
+
+    def __countCalls(self, method, direction, count_records):
+        m_name = method.__name__
+        def counted(t_name, *args, **kwargs):
+            start = time.perf_counter()
+            rv = method(t_name, *args, **kwargs)
+            seconds = time.perf_counter() - start
+            size = self.elaborated[t_name]['size']
+            records = count_records(rv, size)
+            with self.stats_lock:
+                per_type = self.type_stats.get(t_name)
+                if per_type is None:
+                    per_type = self.type_stats[t_name] = {
+                        d: { 'calls': 0, 'records': 0, 'bytes': 0, 'seconds': 0.0, 'max_seconds': 0.0 }
+                        for d in ('encode', 'decode')
+                    }
+                    per_type['encode']['messages'] = 0
+                counts = per_type[direction]
+                counts['calls'] += 1
+                counts['records'] += records
+                counts['bytes'] += records * size
+                counts['seconds'] += seconds
+                if seconds > counts['max_seconds']:
+                    counts['max_seconds'] = seconds
+                if direction == 'encode':
+                    counts['messages'] += len(self.thread_state.enc_messages)
+            if self.stats_hook is not None:
+                self.stats_hook(m_name, t_name, records, records * size, seconds)
+            return rv
+        counted.__name__ = m_name
+        return counted
+
+    # Returns a snapshot of the stats: how long elaboration took, and
+    # whether it came from the cache; how many elaboration messages
+    # there were of each level; and per type, the encode and decode
+    # counts kept while stats were enabled.
+    def stats(self):
+        levels = {}
+        for level, _ in self.elab_messages:
+            levels[level] = levels.get(level, 0) + 1
+        with self.stats_lock:
+            types = {
+                t_name: { d: dict(counts) for d, counts in per_type.items() }
+                for t_name, per_type in self.type_stats.items()
+            }
+        return {
+            'elaboration': {
+                'seconds': self.elab_seconds,
+                'cached': self.elab_cached,
+                'messages': levels,
+            },
+            'enabled': 'encodeBuffer' in self.__dict__,
+            'types': types,
+        }
 
     def generateCPPHeader(self):
-        return generators.cpp.generate(self.typeinfo, self.elaborated, self.packed)
+        type_ids = { t_name: self.typeId(t_name) for t_name in self.elaborated }
+        return generators.cpp.generate(self.typeinfo, self.elaborated, self.packed, type_ids)
 
 
     def generateCHeader(self):
-        return generators.c.generate(self.typeinfo, self.elaborated, self.packed)
-
+        type_ids = { t_name: self.typeId(t_name) for t_name in self.elaborated }
+        return generators.c.generate(self.typeinfo, self.elaborated, self.packed, type_ids)
+
+    def generatePython(self):
+        return generators.python.generate(self.typeinfo, self.elaborated, self.packed, self.pack_endian == '>')
+
+    # With compact_arrays, decoded arrays of base types other than bool
+    # are no longer lists of python numbers: each row (last dimension) of
+    # a u8 or i8 array is a bytes object, and each row of any other array
+    # is an array.array. Multi-dimensional arrays are lists of rows. Such
+    # rows are unpacked straight from the buffer without boxing each
+    # element. Encoding accepts either representation.
+    #
+    # With a cache_dir, the elaborated spec is stored there and loaded
+    # back the next time the same spec is elaborated with the same
+    # options, skipping validation and elaboration (see jb/cache.py).
     def __init__(self, configs, big_endian=False, packed=False,
                  max_array_elements=65535, max_struct_size=65535,
-                 max_nesting_depth=16):
-        validate_config_schema(configs)
+                 max_nesting_depth=16, compact_arrays=False, cache_dir=None):
         self.elab_messages = None
         self.elaborated = None
+        self.codecs = None
+        self.leaf_codecs = None
+        self.elem_structs = None
+        self.swap_bytes = None
+        self.fingerprints = {}
+        self.layouts = {}
+        self.leaf_paths = {}
+        self.projections = {}
+        self.leaf_indexes = {}
         self.pack_endian = '>' if big_endian else '<'
+        # whether the encoding's byte order differs from the host's
+        self.swap_bytes = self.pack_endian != ('<' if sys.byteorder == 'little' else '>')
         self.packed = packed
+        self.compact_arrays = compact_arrays
         self.configs = configs
         self.max_array_elements = max_array_elements
         self.max_struct_size = max_struct_size
         self.max_nesting_depth = max_nesting_depth
+        self.stats_lock = threading.Lock()
+        self.thread_state = threading.local()
+        self.stats_hook = None
+        self.type_stats = {}
+        start = time.perf_counter()
+        self.elab_cached = self.__loadOrElaborate(cache_dir)
+        self.elab_seconds = time.perf_counter() - start
+        self.elem_structs = {
+            b_name: struct.Struct(self.pack_endian + b_info['pack'])
+            for b_name, b_info in self.typeinfo.items()
+        }
+        self.codecs = CodecTable(functools.partial(self.__compileCodec, compact_arrays))
+        # decodeColumns and leafPaths want one value per element whatever
+        # the array representation, so compact bufferators keep a second,
+        # plain set of codecs for them
+        self.leaf_codecs = (
+            CodecTable(functools.partial(self.__compileCodec, False)) if compact_arrays else self.codecs
+        )
+
+    # returns whether the elaborated spec came from the cache
+    def __loadOrElaborate(self, cache_dir):
+        key = None
+        if cache_dir is not None:
+            try:
+                key = cache.elaborationKey(
+                    self.configs, self.packed, self.max_array_elements,
+                    self.max_struct_size, self.max_nesting_depth
+                )
+            except (TypeError, ValueError):
+                # not even json; let validation say what's wrong with it
+                pass
+        if key is not None:
+            cached = cache.load(cache_dir, key)
+            if cached is not None:
+                self.elaborated, self.elab_messages = cached
+                return True
+
+        validate_config_schema(self.configs)
         self.__elaborateConfigs()
 
+        if key is not None:
+            try:
+                cache.store(cache_dir, key, self.elaborated, self.elab_messages)
+            except OSError as e:
+                self.elab_messages.append(('warning', f'could not write elaboration cache: {e}'))
+        return False
+
+    # Returns a bufferator for configs, shared with every other caller
+    # that asks for the same spec with the same options, so that a
+    # process elaborates each distinct spec only once. Shared bufferators
+    # should be treated as read-only.
+    @classmethod
+    def shared(cls, configs, **options):
+        key = json.dumps([configs, sorted(options.items())], separators=(',', ':'), default=str)
+        bufferator = cls.shared_bufferators.get(key)
+        if bufferator is None:
+            bufferator = cls.shared_bufferators.setdefault(key, cls(configs, **options))
+        return bufferator
+
 
 
 def getArgs():
@@ -467,6 +1341,13 @@ def getArgs():
         type=str,
         default=None,
     )
+    ap.add_argument(
+        '-gpy', '--generate-py',
+        help='generate a standalone python encode/decode module. Provide the name of the file to write',
+        nargs=1,
+        type=str,
+        default=None,
+    )
     ap.add_argument(
         '--dump',
         help='show the detailed struct info after elaboration; useful for debug',
@@ -474,7 +1355,8 @@ def getArgs():
     )
     ap.add_argument(
         '-b' ,'--big-endian',
-        help='tell the python code to use big-endian encodings. Does not affect the headers!',
+        help='tell the python code to use big-endian encodings. Does not affect the C/C++ headers, '
+             'whose records are in the byte order of the host; frame type ids are the same either way',
         action='store_true',
     )
     ap.add_argument(
@@ -500,6 +1382,32 @@ def getArgs():
         type=int,
         default=16,
     )
+    ap.add_argument(
+        '--cache-dir',
+        help='directory in which to cache elaborated specs, so that later runs over the same spec skip elaboration',
+        type=str,
+        default=None,
+    )
+    ap.add_argument(
+        '-j', '--jobs',
+        help='with --records, convert using this many processes',
+        type=int,
+        default=1,
+    )
+    ap.add_argument(
+        '--serve',
+        help='after loading the spec, serve encode and decode requests on a unix domain socket at this path (see jb/server.py)',
+        metavar='SOCKET_PATH',
+        type=str,
+        default=None,
+    )
+    ap.add_argument(
+        '--serve-config',
+        help='another spec for --serve to load, which requests can name as "spec": NAME. Can be repeated',
+        metavar='NAME=CONFIG',
+        action='append',
+        default=[],
+    )
     meg = ap.add_mutually_exclusive_group()
     meg.add_argument(
         '-d', '--decode',
@@ -518,6 +1426,23 @@ def getArgs():
         help='name of type in spec file to use for encode or decode',
         type=str
     )
+    ap.add_argument(
+        '-r', '--records',
+        help='treat the binary file as consecutive records of --type, and the json as a list of them',
+        action='store_true',
+    )
+    ap.add_argument(
+        '--stats',
+        help='print how long elaboration, encoding and decoding took',
+        action='store_true',
+    )
+    ap.add_argument(
+        '--format',
+        help='json: the records as one json document. ndjson: one compact json record per line, '
+             'converted as they are read so that files of any size take little memory; implies --records',
+        choices=['json', 'ndjson'],
+        default='json',
+    )
     return ap.parse_args()
 
 
@@ -528,21 +1453,36 @@ def showMessages(name, messages):
         print(f'{m[0]:6} {m[1]}')
 
 
+def showLeafIndex(t_name, index):
+    print()
+    print(f'Leaf Offsets of {t_name}')
+    print('offset     size type   format path')
+    print('---------- ---- ------ ------ ----------------------------------------')
+    for path, (offset, l_type, l_struct) in index.items():
+        print(f'0x{offset:08x} {l_struct.size:4} {l_type:6} {l_struct.format:6} {path}')
+
+
 def main(args):
-    j = JustBufferator(
-        json.loads(args.config.read()),
-        big_endian=args.big_endian,
-        packed=args.packed,
-        max_array_elements=args.max_array_elements,
-        max_struct_size=args.max_struct_size,
-        max_nesting_depth=args.max_nesting_depth
-    )
+    options = {
+        'big_endian': args.big_endian,
+        'packed': args.packed,
+        'max_array_elements': args.max_array_elements,
+        'max_struct_size': args.max_struct_size,
+        'max_nesting_depth': args.max_nesting_depth,
+        'cache_dir': args.cache_dir,
+    }
+    configs = json.loads(args.config.read())
+    j = JustBufferator(configs, **options)
     showMessages('Elaboration Messages:', j.elab_messages)        
+    if args.stats:
+        j.enableStats()
 
     if args.dump:
         print('Elaborated Struct Info')
         print('----------------------')
         print(json.dumps(j.elaborated, indent=2))
+        for t_name in j.elaborated:
+            showLeafIndex(t_name, j.leafIndex(t_name))
 
     if args.generate_c is not None:
         output_path = validate_output_path(args.generate_c[0], 'C header output')
@@ -556,23 +1496,92 @@ def main(args):
         with open(output_path, 'w') as ofh:
             ofh.write(h)
 
+    if args.generate_py is not None:
+        output_path = validate_output_path(args.generate_py[0], 'python module output')
+        m = j.generatePython()
+        with open(output_path, 'w') as ofh:
+            ofh.write(m)
+
     if (args.decode or args.encode) and not args.type:
         print('If encoding or decoding, you need to specify the name of struct with --type')
 
-    if args.decode:
+    if (args.decode or args.encode) and args.jobs > 1 and not args.records:
+        print('--jobs only applies to --records; converting a single record in one process')
+
+    if (args.decode or args.encode) and args.jobs > 1 and args.format == 'ndjson':
+        print('--jobs does not apply to --format ndjson; converting in one process')
+
+    if args.decode and args.format == 'ndjson':
+        input_path = os.path.abspath(args.decode[0])
+        output_path = validate_output_path(args.decode[1], 'decoded NDJSON output')
+        with open(input_path, 'rb') as ifh, open(output_path, 'w') as ofh:
+            ndjson.decodeFile(j, args.type, ifh, ofh)
+    elif args.encode and args.format == 'ndjson':
+        input_path = os.path.abspath(args.encode[0])
+        output_path = validate_output_path(args.encode[1], 'encoded binary output')
+        with open(input_path, 'r') as ifh, open(output_path, 'wb') as ofh:
+            ndjson.encodeFile(j, args.type, ifh, ofh)
+    elif args.decode and args.records and args.jobs > 1:
+        input_path = os.path.abspath(args.decode[0])
+        output_path = validate_output_path(args.decode[1], 'decoded JSON output')
+        with open(output_path, 'w') as ofh:
+            parallel.decodeFile(j, options, args.type, input_path, ofh, args.jobs)
+    elif args.encode and args.records and args.jobs > 1:
+        input_path = os.path.abspath(args.encode[0])
+        output_path = validate_output_path(args.encode[1], 'encoded binary output')
+        with open(input_path, 'r') as ifh:
+            values = json.loads(ifh.read())
+        with open(output_path, 'wb') as ofh:
+            parallel.encodeFile(j, options, args.type, values, ofh, args.jobs)
+    elif args.decode:
         input_path = os.path.abspath(args.decode[0])
         output_path = validate_output_path(args.decode[1], 'decoded JSON output')
         with open(input_path, 'rb') as ifh:
-            d = j.decodeBuffer(args.type, ifh.read())
+            # an empty file can't be mapped, but holds no records
+            if os.fstat(ifh.fileno()).st_size == 0:
+                mapped = contextlib.nullcontext(b'')
+            else:
+                mapped = mmap.mmap(ifh.fileno(), 0, access=mmap.ACCESS_READ)
+            with mapped as mm:
+                if args.records:
+                    d = j.decodeMany(args.type, mm)
+                else:
+                    d = j.decodeBuffer(args.type, mm)
         with open(output_path, 'w') as ofh:
             ofh.write(json.dumps(d, indent=2))
     elif args.encode:
         input_path = os.path.abspath(args.encode[0])
         output_path = validate_output_path(args.encode[1], 'encoded binary output')
         with open(input_path, 'r') as ifh:
-            b = j.encodeBuffer(args.type, json.loads(ifh.read()))
+            if args.records:
+                b = j.encodeMany(args.type, json.loads(ifh.read()))
+            else:
+                b = j.encodeBuffer(args.type, json.loads(ifh.read()))
         with open(output_path, 'wb') as ofh:
             ofh.write(b)
+
+    if args.stats:
+        print('Stats')
+        print('-----')
+        print(json.dumps(j.stats(), indent=2))
+
+    if args.serve:
+        socket_path = validate_output_path(args.serve, 'server socket')
+        bufferators = { server.DEFAULT_SPEC: j }
+        for named in args.serve_config:
+            name, _, path = named.partition('=')
+            if not name or not path:
+                print(f'--serve-config wants NAME=CONFIG, not "{named}"')
+                sys.exit(-1)
+            with open(path, 'r') as ifh:
+                bufferators[name] = JustBufferator(json.loads(ifh.read()), **options)
+        print(f'Serving on {socket_path}')
+        sys.stdout.flush()
+        try:
+            server.serve(socket_path, bufferators)
+        except FileExistsError as e:
+            print(e)
+            sys.exit(-1)
         
 if __name__ == '__main__':
     main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import json
+
+from . import stream
+
+# Conversion between files of records and newline-delimited json: one
+# record per line, as compact json. Records are converted as they are
+# read and written out a batch at a time, so memory use is the same
+# whatever the size of the files.
+
+# how many records are held before being written out
+BATCH_RECORDS = 1024
+
+
+# Writes every whole record of ifh, a binary file, to ofh, a text file,
+# one line each. As with decodeMany, bytes at the end that don't make up
+# a whole record are ignored. Returns the number of records.
+def decodeFile(bufferator, t_name, ifh, ofh):
+    dumps = json.JSONEncoder(separators=(',', ':')).encode
+    lines = []
+    count = 0
+    # every record is decoded into the same dict; it only has to last
+    # until it is turned into text
+    reader = stream.RecordReader(bufferator, t_name, ifh, reuse=True)
+    try:
+        for record in reader:
+            lines.append(dumps(record))
+            if len(lines) == BATCH_RECORDS:
+                lines.append('')
+                ofh.write('\n'.join(lines))
+                count += BATCH_RECORDS
+                lines.clear()
+    except EOFError:
+        pass
+    if lines:
+        lines.append('')
+        ofh.write('\n'.join(lines))
+        count += len(lines) - 1
+    return count
+
+
+# Encodes every line of ifh, a text file of json records, and writes the
+# records to ofh, a binary file. Blank lines are skipped. Returns the
+# number of records.
+def encodeFile(bufferator, t_name, ifh, ofh):
+    size = bufferator.elaborated[t_name]['size']
+    batch = bytearray(size * BATCH_RECORDS)
+    filled = 0
+    count = 0
+    for number, line in enumerate(ifh, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f'line {number} is not a json record: {e}') from e
+        bufferator.encodeInto(t_name, data, batch, filled * size)
+        filled += 1
+        if filled == BATCH_RECORDS:
+            ofh.write(batch)
+            count += filled
+            filled = 0
+    with memoryview(batch) as mv:
+        ofh.write(mv[:filled * size])
+    return count + filled
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import collections
+import concurrent.futures
+import itertools
+import json
+import mmap
+
+# Converts big files of records on several cores. The records are split
+# into chunks on record boundaries and the chunks are handed to a pool of
+# worker processes, each holding its own JustBufferator. The results are
+# written out in the original order, as each becomes ready, so the
+# output is exactly what a single process would write. Only a few
+# chunks per worker are in flight at once, so results waiting to be
+# written (and, for encoding, values waiting to be sent) don't pile up
+# in memory when the output is slower than the workers.
+#
+# Decoding workers map the input file themselves and are only told which
+# records to decode, so no binary data passes between processes. Each
+# worker also turns its records into json text, which is most of the
+# work.
+
+# roughly how many input bytes each decoding task covers
+CHUNK_BYTES = 4 << 20
+# how many records each encoding task covers
+CHUNK_RECORDS = 4096
+# how many tasks per worker are submitted ahead of the one being written
+TASKS_PER_WORKER = 2
+
+# the worker's bufferator and open input, set up once per worker process
+worker = {}
+
+
+def initWorker(configs, options, input_path=None):
+    from .justbuffers import JustBufferator
+    worker['j'] = JustBufferator(configs, **options)
+    if input_path is not None:
+        worker['fh'] = open(input_path, 'rb')
+        worker['mm'] = mmap.mmap(worker['fh'].fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# returns the records as the inside of the json list that json.dumps
+# with indent=2 would make of them, without the brackets
+def decodeChunk(t_name, offset, count):
+    text = json.dumps(worker['j'].decodeMany(t_name, worker['mm'], count, offset), indent=2)
+    return text[2:-2]
+
+
+def encodeChunk(t_name, values):
+    return worker['j'].encodeMany(t_name, values)
+
+
+# Like pool.map(fn, *zip(*tasks)), but with only window tasks submitted
+# ahead of the result being yielded. tasks is only consumed as results
+# are taken, and the next task is submitted before each result is
+# yielded, so the workers stay busy while it is written.
+def mapBounded(pool, fn, tasks, window):
+    tasks = iter(tasks)
+    pending = collections.deque(pool.submit(fn, *task) for task in itertools.islice(tasks, window))
+    while pending:
+        result = pending.popleft().result()
+        for task in itertools.islice(tasks, 1):
+            pending.append(pool.submit(fn, *task))
+        yield result
+
+
+# bufferator is the caller's own, built from its configs with options;
+# each worker builds another from the same.
+def decodeFile(bufferator, options, t_name, input_path, ofh, jobs):
+    configs = bufferator.configs
+    size = bufferator.elaborated[t_name]['size']
+    with open(input_path, 'rb') as ifh:
+        ifh.seek(0, 2)
+        count = ifh.tell() // size
+    if not count:
+        ofh.write('[]')
+        return
+
+    per_chunk = max(1, CHUNK_BYTES // size)
+    chunks = ( (t_name, start * size, min(per_chunk, count - start)) for start in range(0, count, per_chunk) )
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=initWorker, initargs=(configs, options, input_path)) as pool:
+        ofh.write('[\n')
+        for i, text in enumerate(mapBounded(pool, decodeChunk, chunks, jobs * TASKS_PER_WORKER)):
+            if i:
+                ofh.write(',\n')
+            ofh.write(text)
+        ofh.write('\n]')
+
+
+def encodeFile(bufferator, options, t_name, values, ofh, jobs):
+    configs = bufferator.configs
+    chunks = ( (t_name, values[start:start + CHUNK_RECORDS]) for start in range(0, len(values), CHUNK_RECORDS) )
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=initWorker, initargs=(configs, options)) as pool:
+        for encoded in mapBounded(pool, encodeChunk, chunks, jobs * TASKS_PER_WORKER):
+            ofh.write(encoded)
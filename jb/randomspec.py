@@ -36,6 +36,9 @@ def makeSpecObject():
                 return candidate
 
 
+    # only base types that can make random values one element at a time
+    base_types = [ k for k, v in justbuffers.get_base_types().items() if 'rand' in v ]
+
     # generates a spec that includes members of the base types only,
     # plus any types specified as an argument
     def makeSimple(more_types=[]):
@@ -45,7 +48,7 @@ def makeSpecObject():
         }
         elem_count = random.randint(1, 15)
         for i in range(elem_count):
-            elem_type = random.choice(list(justbuffers.get_base_types().keys()) + more_types)
+            elem_type = random.choice(base_types + more_types)
             elem_dims = random.randint(0, 3)
             elem_sizes = [ random.randint(1,10) for i in range(elem_dims) ]
             if elem_dims > 0:
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+import mmap
+import os
+import struct
+
+# A RecordFile is a file of consecutive fixed-size records of a single
+# type, optionally preceded by a small header. The file is memory-mapped,
+# and records are decoded straight from the mapping only when they are
+# accessed, so reading record 900,000 costs the same as reading record 0.
+# Opened writable, records can be edited in place through views.
+#
+# The header is:
+#   magic       4 bytes  b'JBRF'
+#   version     u8
+#   reserved    u8
+#   name_len    u16      length of the type name
+#   fingerprint 8 bytes  JustBufferator.layoutFingerprint() of the type
+#   name        name_len bytes of utf-8
+# padded with zeros to a multiple of 8 bytes so that the records that
+# follow stay aligned.
+
+HEADER_MAGIC = b'JBRF'
+HEADER_VERSION = 1
+HEADER_STRUCT = struct.Struct('<4sBBH8s')
+
+
+class RecordFileError(Exception):
+    """Raised when a record file does not match the type it is opened as"""
+    pass
+
+
+def makeHeader(bufferator, t_name):
+    name = t_name.encode('utf-8')
+    header = HEADER_STRUCT.pack(
+        HEADER_MAGIC, HEADER_VERSION, 0, len(name), bufferator.layoutFingerprint(t_name)
+    ) + name
+    return header + bytes(-len(header) % 8)
+
+
+class RecordFile():
+
+    # header can be True (the file must have a header), False (the file
+    # is nothing but records) or None (use a header if there is one).
+    def __init__(self, bufferator, t_name, path, header=None, chunk_records=1024,
+                 writable=False):
+        self.bufferator = bufferator
+        self.t_name = t_name
+        self.path = path
+        self.size = bufferator.elaborated[t_name]['size']
+        self.chunk_records = chunk_records
+        self.fh = open(path, 'r+b' if writable else 'rb')
+        self.mm = None
+        self.offset = 0
+        try:
+            if os.fstat(self.fh.fileno()).st_size:
+                access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+                self.mm = mmap.mmap(self.fh.fileno(), 0, access=access)
+            self.offset = self.__checkHeader(header)
+        except Exception:
+            self.close()
+            raise
+
+    def __checkHeader(self, header):
+        mm = self.mm
+        has_header = (
+            mm is not None and len(mm) >= HEADER_STRUCT.size
+            and mm[:len(HEADER_MAGIC)] == HEADER_MAGIC
+        )
+        if header is None:
+            header = has_header
+        if not header:
+            return 0
+        if not has_header:
+            raise RecordFileError(f'{self.path} does not start with a record file header')
+
+        magic, version, _, name_len, fingerprint = HEADER_STRUCT.unpack_from(mm, 0)
+        if version != HEADER_VERSION:
+            raise RecordFileError(f'{self.path} has unsupported header version {version}')
+        name = mm[HEADER_STRUCT.size:HEADER_STRUCT.size + name_len].decode('utf-8', errors='replace')
+        if name != self.t_name:
+            raise RecordFileError(f'{self.path} holds records of type "{name}", not "{self.t_name}"')
+        if fingerprint != self.bufferator.layoutFingerprint(self.t_name):
+            raise RecordFileError(
+                f'{self.path} was written with a different layout of "{self.t_name}" '
+                f'(fingerprint {fingerprint.hex()}, expected '
+                f'{self.bufferator.layoutFingerprint(self.t_name).hex()})'
+            )
+        header_size = HEADER_STRUCT.size + name_len
+        return header_size + (-header_size % 8)
+
+    # Writes values as a new record file, with a header unless told not to.
+    @classmethod
+    def create(cls, bufferator, t_name, path, values, header=True):
+        with open(path, 'wb') as ofh:
+            if header:
+                ofh.write(makeHeader(bufferator, t_name))
+            ofh.write(bufferator.encodeMany(t_name, values))
+        return cls(bufferator, t_name, path, header=header)
+
+    def __len__(self):
+        if self.mm is None:
+            return 0
+        return (len(self.mm) - self.offset) // self.size
+
+    def __checkIndex(self, index):
+        count = len(self)
+        if index < 0:
+            index += count
+        if index < 0 or index >= count:
+            raise IndexError(f'record index {index} out of range for {count} records')
+        return self.offset + index * self.size
+
+    def __getitem__(self, index):
+        count = len(self)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(count)
+            if step == 1:
+                if stop <= start:
+                    return []
+                return self.bufferator.decodeMany(
+                    self.t_name, self.mm, stop - start, self.offset + start * self.size
+                )
+            return [ self[i] for i in range(start, stop, step) ]
+        return self.bufferator.decodeBuffer(self.t_name, self.mm, self.__checkIndex(index))
+
+    # replaces a whole record in place; the file must be writable
+    def __setitem__(self, index, data):
+        self.view(index)._assign(data)
+
+    # returns a lazy view of one record. If the file is writable, so is
+    # the view, and assigning to its members edits the file in place.
+    def view(self, index):
+        return self.bufferator.view(self.t_name, self.mm, self.__checkIndex(index))
+
+    def __iter__(self):
+        count = len(self)
+        for start in range(0, count, self.chunk_records):
+            yield from self.bufferator.decodeMany(
+                self.t_name, self.mm, min(self.chunk_records, count - start),
+                self.offset + start * self.size
+            )
+
+    def flush(self):
+        if self.mm is not None:
+            self.mm.flush()
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
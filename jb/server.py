@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import struct
+import sys
+
+# A long-running codec server, so that tools written in other languages
+# can encode and decode without starting python and loading a spec for
+# every file. It listens on a Unix domain socket, serves any number of
+# clients at once (a thread each), and each client can make any number
+# of requests over its connection.
+#
+# Everything on the wire is a frame: a 4 byte big-endian length followed
+# by that many bytes. A request is two frames, a json header and a body:
+#
+#   header: { "op": "decode", "type": "t1" }
+#   body:   the binary record
+#
+# and the reply is two frames as well, a json status and a body:
+#
+#   status: { "ok": true }                  or { "ok": false, "error": "..." }
+#   body:   the record as json text         or empty
+#
+# The ops are:
+#   decode  body is binary, reply is json
+#   encode  body is json, reply is binary
+#   types   body is ignored, reply is a json object of the size of every type
+#
+# decode and encode take "records": true to work on a file of many
+# consecutive records, where the json is a list of them (decodeMany and
+# encodeMany). A server can hold several specs; requests pick one with
+# "spec": "<name>", and use the default spec if they don't.
+
+LENGTH = struct.Struct('>I')
+DEFAULT_SPEC = ''
+
+
+class ServerError(Exception):
+    """Raised by a Client when the server could not carry out a request"""
+    pass
+
+
+def readFrame(rfile):
+    head = rfile.read(LENGTH.size)
+    if not head:
+        return None
+    if len(head) < LENGTH.size:
+        raise EOFError('connection closed inside a frame length')
+    length, = LENGTH.unpack(head)
+    data = rfile.read(length)
+    if len(data) < length:
+        raise EOFError(f'connection closed {len(data)} bytes into a {length} byte frame')
+    return data
+
+
+def makeFrames(*frames):
+    return b''.join([ LENGTH.pack(len(f)) + f for f in frames ])
+
+
+# A socket file left behind by a server that didn't exit cleanly would
+# make bind fail, so it is removed. Anything else at path is left alone:
+# a file that isn't a socket, or the socket of a server that is still
+# answering, raises FileExistsError.
+def removeStaleSocket(path):
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f'{path} exists and is not a socket; refusing to replace it')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            pass
+        else:
+            raise FileExistsError(f'a server is already listening on {path}')
+    os.unlink(path)
+
+
+class CodecServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    # bufferators maps spec names to the JustBufferator for each spec;
+    # the one named DEFAULT_SPEC serves requests that don't name one
+    def __init__(self, path, bufferators):
+        self.bufferators = bufferators
+        removeStaleSocket(path)
+        super().__init__(path, RequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+    def carryOut(self, header, body):
+        j = self.bufferators[header.get('spec', DEFAULT_SPEC)]
+        op = header['op']
+        if op == 'types':
+            return json.dumps({ t_name: t_info['size'] for t_name, t_info in j.elaborated.items() }).encode('utf-8')
+
+        t_name = header['type']
+        if t_name not in j.elaborated:
+            raise KeyError(f"unknown type '{t_name}'")
+        records = header.get('records', False)
+        if op == 'decode':
+            if records:
+                d = j.decodeMany(t_name, body)
+            else:
+                d = j.decodeBuffer(t_name, body)
+            return json.dumps(d).encode('utf-8')
+        elif op == 'encode':
+            if records:
+                return j.encodeMany(t_name, json.loads(body))
+            return j.encodeBuffer(t_name, json.loads(body))
+        raise ValueError(f"unknown op '{op}'")
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        while True:
+            try:
+                header = readFrame(self.rfile)
+                if header is None:
+                    return
+                body = readFrame(self.rfile)
+                if body is None:
+                    return
+            except EOFError:
+                return
+
+            try:
+                reply = self.server.carryOut(json.loads(header), body)
+                status = { 'ok': True }
+            except Exception as e:
+                # whatever went wrong, it went wrong for this request only
+                reply = b''
+                status = { 'ok': False, 'error': f'{type(e).__name__}: {e}' }
+            self.wfile.write(makeFrames(json.dumps(status).encode('utf-8'), reply))
+
+
+# serves until interrupted or terminated, then removes the socket file
+def serve(path, bufferators):
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with CodecServer(path, bufferators) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+# A client for the server, mostly for testing it; other languages only
+# need to speak the protocol above.
+class Client():
+
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.rfile = self.sock.makefile('rb')
+
+    def request(self, header, body=b''):
+        self.sock.sendall(makeFrames(json.dumps(header).encode('utf-8'), body))
+        status = readFrame(self.rfile)
+        reply = readFrame(self.rfile)
+        if status is None or reply is None:
+            raise EOFError('server closed the connection')
+        status = json.loads(status)
+        if not status['ok']:
+            raise ServerError(status['error'])
+        return reply
+
+    def decode(self, t_name, data, records=False, spec=DEFAULT_SPEC):
+        return json.loads(self.request(
+            { 'op': 'decode', 'type': t_name, 'records': records, 'spec': spec }, bytes(data)
+        ))
+
+    def encode(self, t_name, value, records=False, spec=DEFAULT_SPEC):
+        return self.request(
+            { 'op': 'encode', 'type': t_name, 'records': records, 'spec': spec },
+            json.dumps(value).encode('utf-8')
+        )
+
+    def types(self, spec=DEFAULT_SPEC):
+        return json.loads(self.request({ 'op': 'types', 'spec': spec }))
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+# Incremental decoding of streams of fixed-size records. Memory use is
+# bounded by the size of a record (or of one read, for RecordReader),
+# no matter how long the stream is.
+
+
+# Yields decoded records of one type from a binary file or socket.
+# Reads go into a single preallocated bytearray with readinto1(),
+# readinto() or recv_into(), so steady-state reading allocates nothing
+# but the decoded records themselves. Records are yielded as soon as a read
+# completes them, which keeps latency low on live streams.
+#
+# With reuse=True every record is decoded into the same object with
+# decodeInto(), so each yielded record is only valid until the next one
+# is read. Copy anything that needs to outlive that.
+class RecordReader():
+
+    def __init__(self, bufferator, t_name, source, records_per_read=None, reuse=False):
+        self.bufferator = bufferator
+        self.t_name = t_name
+        self.reuse = reuse
+        self.size = bufferator.elaborated[t_name]['size']
+        if records_per_read is None:
+            records_per_read = max(1, 65536 // self.size)
+        self.buffer = bytearray(self.size * records_per_read)
+        # readinto1() returns what one read gets, where a buffered
+        # readinto() would wait for the whole buffer to fill
+        for name in ('readinto1', 'readinto', 'recv_into'):
+            readinto = getattr(source, name, None)
+            if readinto is not None:
+                break
+        else:
+            raise TypeError(f'cannot read records from {type(source).__name__}: it has no readinto1, readinto or recv_into')
+        self.readinto = readinto
+
+    def __iter__(self):
+        size = self.size
+        buf = self.buffer
+        fill = 0
+        record = {}
+        with memoryview(buf) as view:
+            while True:
+                got = self.readinto(view[fill:])
+                if not got:
+                    break
+                fill += got
+                count = fill // size
+                if not count:
+                    continue
+                if self.reuse:
+                    for offset in range(0, count * size, size):
+                        yield self.bufferator.decodeInto(self.t_name, view, record, offset)
+                else:
+                    yield from self.bufferator.decodeMany(self.t_name, view, count)
+                used = count * size
+                buf[:fill - used] = buf[used:fill]
+                fill -= used
+
+        if fill:
+            raise EOFError(
+                f'stream ended {fill} bytes into a {size} byte record of {self.t_name}'
+            )
+
+
+# Push parser: feed() it bytes as they arrive and it returns the
+# records they complete. At most one partial record is buffered
+# between calls; whole records in the fed data are decoded in place
+# without being copied.
+class RecordParser():
+
+    def __init__(self, bufferator, t_name):
+        self.bufferator = bufferator
+        self.t_name = t_name
+        self.size = bufferator.elaborated[t_name]['size']
+        self.pending = bytearray()
+
+    def feed(self, data):
+        size = self.size
+        records = []
+        with memoryview(data) as mv, mv.cast('B') as raw:
+            start = 0
+            if self.pending:
+                start = min(size - len(self.pending), raw.nbytes)
+                self.pending += raw[:start]
+                if len(self.pending) < size:
+                    return records
+                records.append(self.bufferator.decodeBuffer(self.t_name, self.pending))
+                self.pending.clear()
+
+            count = (raw.nbytes - start) // size
+            if count:
+                records += self.bufferator.decodeMany(self.t_name, raw, count, start)
+            self.pending += raw[start + count * size:]
+        return records
+
+    # number of bytes of an incomplete record being held
+    def buffered(self):
+        return len(self.pending)
+
+    # call at the end of the stream to check no partial record is left
+    def close(self):
+        if self.pending:
+            raise EOFError(
+                f'stream ended {len(self.pending)} bytes into a {self.size} byte record of {self.t_name}'
+            )
@@ -1,4 +1,6 @@
+import array
 import functools
+import itertools
 import operator
 import subprocess
 
@@ -41,15 +43,56 @@ def unflattenArray(a, dims):
 
 
 # takes an n-dimensional list of list of list.. and turns it into
-# just one list
+# just one list. A list that is already flat is returned as is, not
+# copied.
 def flattenArrays(a):
     if not isinstance(a,(list, tuple)):
         return [a]
-    elif isinstance(a[0], (list, tuple)):
-        return functools.reduce(lambda x, y: x + flattenArrays(y), a, []) 
-    else:
+    elif not a or not isinstance(a[0], (list, tuple)):
         return a
 
+    flat = []
+    def flattenInto(x):
+        for y in x:
+            if not isinstance(y, (list, tuple)):
+                flat.append(y)
+            elif y and isinstance(y[0], (list, tuple)):
+                flattenInto(y)
+            else:
+                flat.extend(y)
+    flattenInto(a)
+    return flat
+
+
+# flattens exactly levels levels of nested lists, so that whatever
+# is below them (strings, bytes, rows of numbers) is kept whole. A value
+# that isn't a list where one is expected is taken as a list of one.
+def flattenLevels(a, levels):
+    a = [a]
+    for _ in range(levels):
+        a = [ y for x in a for y in (x if isinstance(x, (list, tuple)) else [x]) ]
+    return a
+
+
+# makes an array.array of the given typecode from raw bytes, swapping
+# the byte order of each element if needed
+def makeArray(typecode, raw, swap=False):
+    a = array.array(typecode)
+    a.frombytes(raw)
+    if swap:
+        a.byteswap()
+    return a
+
+
+# char rows are NUL-padded utf-8. Bytes that aren't valid utf-8 survive
+# a decode/encode round trip as surrogate escapes.
+def decodeString(raw):
+    return raw.split(b'\0', 1)[0].decode('utf-8', errors='surrogateescape')
+
+
+def encodeString(s):
+    return s.encode('utf-8', errors='surrogateescape')
+
 
 def is_scalar(m_info):
     counts = m_info.get('counts',[1])
@@ -58,3 +101,14 @@ def is_scalar(m_info):
 
 def total_array_count(m_info):
     return functools.reduce(operator.mul, m_info['counts'])
+
+
+# yields the index suffix of every element of an array of the given
+# dimensions, in storage order: '[0][0]', '[0][1]', ... A lone scalar
+# (counts of [1]) has just the empty suffix.
+def indexSuffixes(counts):
+    if len(counts) == 1 and counts[0] == 1:
+        yield ''
+        return
+    for idx in itertools.product(*[ range(c) for c in counts ]):
+        yield ''.join([ f'[{i}]' for i in idx ])
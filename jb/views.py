@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+import struct
+
+from . import util
+
+# Lazy views over an encoded buffer. Nothing is decoded when a view is
+# made; each attribute or item access unpacks just the member it names,
+# at the offset the elaborator computed for it:
+#
+#   v = j.view('t1', data)
+#   v.t0s[1][0].fee        # one unpack_from of 4 bytes
+#   v['t0s'][1][0]['fee']  # same thing
+#
+# Views over a writable buffer (bytearray, writable mmap, shared memory,
+# a memoryview of any of those) can also be assigned to. Assigning to a
+# member packs just that member in place, in the byte order of the
+# bufferator:
+#
+#   v.t0s[0][1].fi = 7     # one pack_into of 2 bytes
+#   v.t0s[0][1] = {...}    # re-encodes only that t0
+#
+# Members whose names clash with a view method can always be reached by
+# item access. Methods of views start with an underscore, like those of
+# namedtuple, to keep clashes unlikely.
+
+
+def _element(bufferator, m_type, elem_struct, buffer, offset):
+    if elem_struct is None:
+        return StructView(bufferator, m_type, buffer, offset)
+    value = elem_struct.unpack_from(buffer, offset)[0]
+    if m_type == 'bool':
+        return bool(value)
+    elif m_type == 'char':
+        return util.decodeString(value)
+    return value
+
+
+def _setElement(bufferator, m_type, elem_struct, buffer, offset, value):
+    if elem_struct is None:
+        StructView(bufferator, m_type, buffer, offset)._assign(value)
+    elif m_type == 'char':
+        if isinstance(value, str):
+            value = util.encodeString(value)
+        if len(value) > elem_struct.size:
+            raise struct.error(f'string of {len(value)} bytes does not fit in {elem_struct.size}')
+        elem_struct.pack_into(buffer, offset, value)
+    else:
+        elem_struct.pack_into(buffer, offset, value)
+
+
+class StructView():
+    __slots__ = ('_bufferator', '_t_name', '_fields', '_buffer', '_offset')
+
+    def __init__(self, bufferator, t_name, buffer, offset=0):
+        object.__setattr__(self, '_bufferator', bufferator)
+        object.__setattr__(self, '_t_name', t_name)
+        object.__setattr__(self, '_fields', bufferator.codecs[t_name]['fields'])
+        object.__setattr__(self, '_buffer', buffer)
+        object.__setattr__(self, '_offset', offset)
+
+    def __getitem__(self, name):
+        m_type, m_offset, counts, elem_size, elem_struct = self._fields[name]
+        offset = self._offset + m_offset
+        if len(counts) == 1 and counts[0] == 1:
+            return _element(self._bufferator, m_type, elem_struct, self._buffer, offset)
+        return ArrayView(self._bufferator, m_type, counts, elem_size, elem_struct, self._buffer, offset)
+
+    def __setitem__(self, name, value):
+        m_type, m_offset, counts, elem_size, elem_struct = self._fields[name]
+        offset = self._offset + m_offset
+        if len(counts) == 1 and counts[0] == 1 and not isinstance(value, (list, tuple)):
+            _setElement(self._bufferator, m_type, elem_struct, self._buffer, offset, value)
+        else:
+            ArrayView(
+                self._bufferator, m_type, counts, elem_size, elem_struct, self._buffer, offset
+            )._assign(value)
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(f"type '{self._t_name}' has no member '{name}'") from None
+
+    def __setattr__(self, name, value):
+        try:
+            self[name] = value
+        except KeyError:
+            raise AttributeError(f"type '{self._t_name}' has no member '{name}'") from None
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __contains__(self, name):
+        return name in self._fields
+
+    def __dir__(self):
+        return list(self._fields)
+
+    def __repr__(self):
+        return f'<{self._t_name} view at offset {self._offset}>'
+
+    def _keys(self):
+        return self._fields.keys()
+
+    # fully decodes the struct, as decodeBuffer would
+    def _decode(self):
+        return self._bufferator.decodeBuffer(self._t_name, self._buffer, self._offset)
+
+    # overwrites the whole struct, as encodeBuffer would; members missing
+    # from data are zeroed
+    def _assign(self, data):
+        self._bufferator.encodeInto(self._t_name, data, self._buffer, self._offset)
+
+
+class ArrayView():
+    __slots__ = ('_bufferator', '_m_type', '_counts', '_elem_size', '_elem_struct',
+                 '_buffer', '_offset', '_stride')
+
+    def __init__(self, bufferator, m_type, counts, elem_size, elem_struct, buffer, offset):
+        self._bufferator = bufferator
+        self._m_type = m_type
+        self._counts = counts
+        self._elem_size = elem_size
+        self._elem_struct = elem_struct
+        self._buffer = buffer
+        self._offset = offset
+        # bytes between consecutive items along the first dimension
+        self._stride = elem_size
+        for c in counts[1:]:
+            self._stride *= c
+
+    def __len__(self):
+        return self._counts[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ self[i] for i in range(*index.indices(self._counts[0])) ]
+        if index < 0:
+            index += self._counts[0]
+        if index < 0 or index >= self._counts[0]:
+            raise IndexError(f'index {index} out of range for array of {self._counts[0]}')
+        offset = self._offset + index * self._stride
+        if len(self._counts) > 1:
+            return ArrayView(
+                self._bufferator, self._m_type, self._counts[1:], self._elem_size,
+                self._elem_struct, self._buffer, offset
+            )
+        return _element(self._bufferator, self._m_type, self._elem_struct, self._buffer, offset)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            indices = range(*index.indices(self._counts[0]))
+            if len(value) != len(indices):
+                raise ValueError(f'cannot assign {len(value)} values to {len(indices)} elements')
+            for i, v in zip(indices, value):
+                self[i] = v
+            return
+        if index < 0:
+            index += self._counts[0]
+        if index < 0 or index >= self._counts[0]:
+            raise IndexError(f'index {index} out of range for array of {self._counts[0]}')
+        offset = self._offset + index * self._stride
+        if len(self._counts) > 1:
+            ArrayView(
+                self._bufferator, self._m_type, self._counts[1:], self._elem_size,
+                self._elem_struct, self._buffer, offset
+            )._assign(value)
+        else:
+            _setElement(self._bufferator, self._m_type, self._elem_struct, self._buffer, offset, value)
+
+    def __iter__(self):
+        for i in range(self._counts[0]):
+            yield self[i]
+
+    def __repr__(self):
+        return f'<{self._m_type}{self._counts} view at offset {self._offset}>'
+
+    # fully decodes the array into nested lists, as decodeBuffer would;
+    # with compact_arrays, rows of base types other than bool come back
+    # as bytes or array.array
+    def _decode(self):
+        if len(self._counts) > 1:
+            return [ a._decode() for a in self ]
+        if self._elem_struct is None:
+            return [ s._decode() for s in self ]
+        if self._m_type == 'char':
+            return list(self)
+        if self._bufferator.compact_arrays and self._m_type != 'bool':
+            raw = struct.unpack_from(f'{self._counts[0] * self._elem_size}s', self._buffer, self._offset)[0]
+            if self._elem_size == 1:
+                return raw
+            return util.makeArray(
+                self._bufferator.typeinfo[self._m_type]['array_type'], raw, self._bufferator.swap_bytes
+            )
+        fmt = self._elem_struct.format
+        values = list(struct.unpack_from(
+            f'{fmt[0]}{self._counts[0]}{fmt[1:]}', self._buffer, self._offset
+        ))
+        if self._m_type == 'bool':
+            values = [ bool(x) for x in values ]
+        return values
+
+    # overwrites the whole array; values must have the array's shape
+    def _assign(self, values):
+        if len(values) != self._counts[0]:
+            raise ValueError(
+                f'cannot assign {len(values)} values to array of {self._counts[0]}'
+            )
+        if len(self._counts) > 1 or self._elem_struct is None or self._m_type == 'char':
+            for i, v in enumerate(values):
+                self[i] = v
+            return
+        fmt = self._elem_struct.format
+        struct.pack_into(
+            f'{fmt[0]}{self._counts[0]}{fmt[1:]}', self._buffer, self._offset, *values
+        )
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import asyncio
+import concurrent.futures
+import json
+import random
+import socket
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__),'../../'))
+
+import jb.justbuffers
+import jb.jscompare
+import jb.asyncstream
+
+# This test checks the asyncio readers and writers over local socket
+# pairs:
+#
+# 0. write runs of random c_simple t1 records with writeRecord and
+#    writeRecords, and read them back with records()
+# 1. do that over many connections at once
+# 2. do it again with decodes offloaded to a thread pool
+# 3. check that a stream ending inside a record is reported
+
+CONNECTIONS = 200
+RECORDS = 20
+
+
+def makeRecords(j, count):
+    size = j.elaborated['t1']['size']
+    return j.decodeMany('t1', bytes([ random.randint(0,255) for i in range(size * count) ]))
+
+
+async def connectedPair():
+    a, b = socket.socketpair()
+    # hold on to both ends' readers and writers, as a writer that is
+    # garbage collected closes its socket
+    reader, reader_end = await asyncio.open_connection(sock=a)
+    writer_end, writer = await asyncio.open_connection(sock=b)
+    return reader, writer, (reader_end, writer_end)
+
+
+async def onePair(j, records, executor=None):
+    reader, writer, ends = await connectedPair()
+
+    async def write():
+        for record in records[:RECORDS // 2]:
+            await jb.asyncstream.writeRecord(j, writer, 't1', record)
+        await jb.asyncstream.writeRecords(j, writer, 't1', records[RECORDS // 2:])
+        writer.close()
+        await writer.wait_closed()
+
+    writing = asyncio.create_task(write())
+    got = [ r async for r in jb.asyncstream.records(j, reader, 't1', executor=executor, offload_bytes=1) ]
+    await writing
+    ends[0].close()
+    assert jb.jscompare.compareSimple(records, got)
+
+
+async def truncated(j):
+    reader, writer, ends = await connectedPair()
+    writer.write(j.encodeBuffer('t1', {})[:-1])
+    writer.close()
+    try:
+        [ r async for r in jb.asyncstream.records(j, reader, 't1') ]
+        assert False
+    except EOFError:
+        pass
+    ends[0].close()
+
+
+async def main(j):
+    records = makeRecords(j, RECORDS)
+
+    print('one connection')
+    await onePair(j, records)
+
+    print(f'{CONNECTIONS} connections')
+    await asyncio.gather(*[ onePair(j, records) for _ in range(CONNECTIONS) ])
+
+    print('offloaded decodes')
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        await asyncio.gather(*[ onePair(j, records, executor) for _ in range(20) ])
+
+    print('truncated stream')
+    await truncated(j)
+
+
+if __name__ == '__main__':
+    with open(os.path.join(os.path.dirname(__file__), '../c_simple/types.json'), 'r') as ifh:
+        j = jb.justbuffers.JustBufferator(json.loads(ifh.read()))
+    asyncio.run(main(j))
+    sys.exit(0)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__),'../../'))
+
+import jb.justbuffers
+
+# This test checks elaboration of the type graph, which needs no
+# compilers:
+#
+# 0. types listed before the types they contain are elaborated after
+#    them, and elaborated comes out in dependency order
+# 1. circular references, including a type containing itself, are
+#    reported along with the cycle
+# 2. the nesting limit is enforced on a deep diamond-shaped graph
+# 3. a spec of 10000 such types loads quickly
+# 4. elaborated specs are cached on disk and reloaded from there, and
+#    shared() hands out one bufferator per distinct spec
+
+def expectError(spec, text, **kwargs):
+    try:
+        jb.justbuffers.JustBufferator(spec, **kwargs)
+    except jb.justbuffers.ElaborationError as e:
+        assert text in str(e), str(e)
+        return
+    assert False, f'no error for {spec}'
+
+
+def diamonds(n_types, depth):
+    spec = {}
+    for i in range(n_types):
+        level = i % depth
+        members = [ { 'name': 'id', 'type': 'u32' } ]
+        if level >= 1:
+            members.append({ 'name': 'a', 'type': f't{i - 1}' })
+        if level >= 2:
+            members.append({ 'name': 'b', 'type': f't{i - 2}' })
+        spec[f't{i}'] = members
+    return dict(reversed(list(spec.items())))
+
+
+if __name__ == '__main__':
+    print('forward references')
+    j = jb.justbuffers.JustBufferator({
+        'outer': [ { 'name': 'm', 'type': 'middle', 'counts': 2 }, { 'name': 'x', 'type': 'u8' } ],
+        'middle': [ { 'name': 'i', 'type': 'inner' }, { 'name': 'y', 'type': 'u16' } ],
+        'inner': [ { 'name': 'z', 'type': 'u32' } ],
+    })
+    assert list(j.elaborated) == ['inner', 'middle', 'outer']
+    assert j.elaborated['outer']['size'] == 24
+    assert j.decodeBuffer('outer', j.encodeBuffer('outer', { 'm': [ { 'i': { 'z': 7 } } ] }))['m'][0]['i']['z'] == 7
+
+    print('cycles')
+    expectError({
+        'a': [ { 'name': 'x', 'type': 'b' } ],
+        'b': [ { 'name': 'y', 'type': 'c' } ],
+        'c': [ { 'name': 'z', 'type': 'a' } ],
+        'd': [ { 'name': 'w', 'type': 'u8' } ],
+    }, 'a -> b -> c -> a')
+    expectError({ 'me': [ { 'name': 'again', 'type': 'me' } ] }, 'me -> me')
+
+    print('nesting limit')
+    expectError(diamonds(40, 40), 'exceeds limit of 16')
+    assert jb.justbuffers.JustBufferator(diamonds(40, 17))
+
+    print('many types')
+    j = jb.justbuffers.JustBufferator(diamonds(10000, 16))
+    assert len(j.elaborated) == 10000
+    assert j.decodeBuffer('t15', bytes(j.elaborated['t15']['size']))['a']['b']['id'] == 0
+
+    print('cache')
+    spec = diamonds(100, 16)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        first = jb.justbuffers.JustBufferator(spec, cache_dir=cache_dir)
+        entries = os.listdir(cache_dir)
+        assert len(entries) == 1
+        again = jb.justbuffers.JustBufferator(spec, cache_dir=cache_dir)
+        assert list(again.elaborated) == list(first.elaborated)
+        assert again.elaborated == first.elaborated and again.elab_messages == first.elab_messages
+        jb.justbuffers.JustBufferator(spec, cache_dir=cache_dir, packed=True)
+        assert len(os.listdir(cache_dir)) == 2
+
+        # a damaged entry is ignored and replaced
+        with open(os.path.join(cache_dir, entries[0]), 'wb') as ofh:
+            ofh.write(b'not an entry')
+        again = jb.justbuffers.JustBufferator(spec, cache_dir=cache_dir)
+        assert again.elaborated == first.elaborated
+        assert jb.justbuffers.JustBufferator(spec, cache_dir=cache_dir).elaborated == first.elaborated
+
+    a = jb.justbuffers.JustBufferator.shared(spec)
+    assert jb.justbuffers.JustBufferator.shared(diamonds(100, 16)) is a
+    assert jb.justbuffers.JustBufferator.shared(spec, packed=True) is not a
+
+    sys.exit(0)
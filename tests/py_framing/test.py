@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import json
+import random
+import shutil
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__),'../../'))
+
+import jb.justbuffers
+import jb.jscompare
+import jb.framing
+
+# This test checks framed streams of mixed types:
+#
+# 0. frame a random mix of c_simple t0 and t1 records, with and without
+#    CRCs, and decode them back, whole and fed in random pieces through
+#    a Dispatcher, with and without handlers
+# 1. check that corrupt, truncated and unknown frames are reported, and
+#    that unknown frames can be skipped, that a known type with a
+#    corrupt length is reported from its header alone, and that frames of the other
+#    byte order have the same type ids but are refused
+# 2. with gcc and g++, build a small program against the generated C and
+#    C++ headers that reads the frames, and writes each record back out
+#    in a new frame; check those against the python frames
+
+SPEC = os.path.join(os.path.dirname(__file__), '../c_simple/types.json')
+JB = os.path.join(os.path.dirname(__file__), '../../jb.py')
+
+# reads frames from argv[1] and writes them to argv[2] with CRCs, and
+# prints the type names it saw
+C_PROGRAM = r'''
+#include <stdio.h>
+#include <stdlib.h>
+#include HEADER
+
+int main(int argc, char *argv[]) {
+    static uint8_t in[1 << 20], out[1 << 20];
+    FILE *f = fopen(argv[1], "rb");
+    size_t in_len = fread(in, 1, sizeof(in), f);
+    fclose(f);
+
+    // a known type id with a corrupt length is refused from the header
+    // alone, rather than waited on
+    jb_frame_header header;
+    const void *record;
+    uint8_t bad[JB_FRAME_HEADER_SIZE];
+    memcpy(bad, in, sizeof(bad));
+    bad[8] ^= 0xf0;
+    if (jb_frame_read(bad, sizeof(bad), &header, &record) != JB_FRAME_BAD_LENGTH) {
+        fprintf(stderr, "corrupt length not refused\n");
+        return 1;
+    }
+
+    size_t pos = 0, out_len = 0;
+    while (pos < in_len) {
+        long got = jb_frame_read(in + pos, in_len - pos, &header, &record);
+        if (got <= 0) {
+            fprintf(stderr, "bad frame at %zu: %ld\n", pos, got);
+            return 1;
+        }
+        printf("%s\n", jb_type_name(header.type_id));
+        out_len += jb_frame_write(out + out_len, sizeof(out) - out_len, header.type_id, record, header.length, 1);
+        pos += got;
+    }
+
+    f = fopen(argv[2], "wb");
+    fwrite(out, 1, out_len, f);
+    fclose(f);
+    return 0;
+}
+'''
+
+
+def randomValues(j, count):
+    values = []
+    for _ in range(count):
+        t_name = random.choice([ 't0', 't1' ])
+        size = j.elaborated[t_name]['size']
+        values.append((t_name, j.decodeBuffer(t_name, bytes([ random.randint(0,255) for i in range(size) ]))))
+    return values
+
+
+def checkRoundTrip(j, values, crc):
+    framer = jb.framing.Framer(j, crc=crc)
+    frames = framer.encodeFrames(values)
+    assert frames == b''.join([ framer.encodeFrame(t_name, data) for t_name, data in values ])
+
+    records, used = framer.decodeFrames(frames)
+    assert used == len(frames)
+    assert jb.jscompare.compareSimple(values, records)
+
+    dispatcher = jb.framing.Dispatcher(framer)
+    records = []
+    pos = 0
+    while pos < len(frames):
+        step = random.randint(1, 700)
+        records += dispatcher.feed(frames[pos:pos + step])
+        pos += step
+    dispatcher.close()
+    assert jb.jscompare.compareSimple(values, records)
+
+    t1s = []
+    dispatcher = jb.framing.Dispatcher(framer, handlers={ 't1': t1s.append })
+    t0s = dispatcher.feed(frames)
+    assert jb.jscompare.compareSimple([ d for t, d in values if t == 't1' ], t1s)
+    assert jb.jscompare.compareSimple([ v for v in values if v[0] == 't0' ], t0s)
+    return frames
+
+
+def expectError(fn, *args):
+    try:
+        fn(*args)
+        assert False, 'no error raised'
+    except jb.framing.FramingError as e:
+        return str(e)
+
+
+def checkErrors(j, values):
+    framer = jb.framing.Framer(j, crc=True)
+    frame = bytearray(framer.encodeFrame(*values[0]))
+
+    corrupt = bytearray(frame)
+    corrupt[-1] ^= 0xff
+    assert 'CRC' in expectError(framer.decodeFrame, corrupt)
+    assert 'past the end' in expectError(framer.decodeFrame, frame[:-1])
+    assert 'no frame header' in expectError(framer.decodeFrame, b'x' * 32)
+
+    # a known type with a corrupt length is reported from the header,
+    # without waiting for the length it claims
+    header = bytearray(frame[:jb.framing.HEADER_STRUCT.size])
+    header[8:12] = (0xfffffff0).to_bytes(4, 'little')
+    assert 'holds' in expectError(framer.decodeFrame, header)
+    assert 'holds' in expectError(jb.framing.Dispatcher(framer).feed, header + frame[16:100])
+
+    dispatcher = jb.framing.Dispatcher(framer)
+    assert dispatcher.feed(frame[:-1]) == []
+    assert dispatcher.buffered() == len(frame) - 1
+    try:
+        dispatcher.close()
+        assert False
+    except EOFError:
+        pass
+
+    # a frame of a type this spec doesn't have
+    other = jb.justbuffers.JustBufferator({ 'other': [ { 'name': 'x', 'type': 'u32' } ] })
+    stranger = jb.framing.Framer(other).encodeFrame('other', { 'x': 5 })
+    assert 'unknown type id' in expectError(framer.decodeFrame, stranger)
+    skipper = jb.framing.Framer(j, skip_unknown=True)
+    assert skipper.decodeFrames(stranger[:-1]) == ([], 0)
+    records, used = skipper.decodeFrames(stranger + bytes(frame))
+    assert used == len(stranger) + len(frame)
+    assert jb.jscompare.compareSimple([ values[0] ], records)
+
+    # the same name with a different layout gets a different id, but
+    # byte order goes in a flag rather than the id, and is checked
+    packed = jb.justbuffers.JustBufferator(j.configs, packed=True)
+    assert packed.typeId('t0') != j.typeId('t0')
+    big = jb.justbuffers.JustBufferator(j.configs, big_endian=True)
+    assert big.typeId('t1') == j.typeId('t1')
+    assert big.layoutFingerprint('t1') != j.layoutFingerprint('t1')
+    big_framer = jb.framing.Framer(big, crc=True)
+    big_frame = big_framer.encodeFrame(*values[0])
+    assert jb.jscompare.compareSimple(values[0], big_framer.decodeFrame(big_frame)[:2])
+    assert 'big-endian' in expectError(framer.decodeFrame, big_frame)
+    assert 'little-endian' in expectError(big_framer.decodeFrame, bytes(frame))
+
+
+def checkGenerated(j, values, frames, tmp):
+    # the headers are the same with -b
+    for flags in ([], [ '-b' ]):
+        subprocess.run([ sys.executable, JB, '-c', SPEC, '-gc', os.path.join(tmp, 'types.h'),
+                         '-gcpp', os.path.join(tmp, 'types.hpp') ] + flags, check=True, stdout=subprocess.DEVNULL)
+        with open(os.path.join(tmp, 'types.h'), 'r') as ifh:
+            ids = [ line for line in ifh if line.startswith('#define JB_TYPE_ID_') ]
+        if flags:
+            assert ids == little_ids
+        little_ids = ids
+    with open(os.path.join(tmp, 'frames.c'), 'w') as ofh:
+        ofh.write(C_PROGRAM)
+    with open(os.path.join(tmp, 'in.bin'), 'wb') as ofh:
+        ofh.write(frames)
+    expected = jb.framing.Framer(j, crc=True).encodeFrames(values)
+
+    builds = [
+        ('gcc', [ '-x', 'c', '-DHEADER="types.h"' ]),
+        ('g++', [ '-x', 'c++', '--std=c++17', '-DHEADER="types.hpp"' ]),
+    ]
+    for compiler, flags in builds:
+        if shutil.which(compiler) is None:
+            print(f'  no {compiler}, skipping')
+            continue
+        print(f'  {compiler}')
+        program = os.path.join(tmp, 'frames_' + compiler.replace('+', 'p'))
+        subprocess.run([ compiler ] + flags + [ '-I', tmp, '-o', program, os.path.join(tmp, 'frames.c') ], check=True)
+        out = os.path.join(tmp, 'out.bin')
+        names = subprocess.run([ program, os.path.join(tmp, 'in.bin'), out ],
+                               check=True, capture_output=True, text=True).stdout.split()
+        assert names == [ t_name for t_name, _ in values ]
+        with open(out, 'rb') as ifh:
+            assert ifh.read() == expected
+
+
+if __name__ == '__main__':
+    with open(SPEC, 'r') as ifh:
+        j = jb.justbuffers.JustBufferator(json.loads(ifh.read()))
+    values = randomValues(j, 50)
+
+    print('round trip')
+    frames = checkRoundTrip(j, values, False)
+    checkRoundTrip(j, values, True)
+
+    print('errors')
+    checkErrors(j, values)
+
+    print('generated headers')
+    with tempfile.TemporaryDirectory() as tmp:
+        checkGenerated(j, values, frames, tmp)
+
+    sys.exit(0)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import random
+import struct
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__),'../../'))
+
+import jb.justbuffers
+import jb.randomspec
+
+# This test checks the leaf index and getField/setField:
+#
+# 0. for random specs, check that the index has every leaf path in
+#    order, at increasing offsets inside the record
+# 1. read every leaf with getField and check it against decodeColumns
+# 2. set random leaves with setField and check that decodeColumns sees
+#    just those changes
+# 3. do the same with strings, and check unknown paths are reported
+
+STRING_SPEC = {
+    'named': [
+        { 'type': 'u16',  'name': 'id' },
+        { 'type': 'char', 'name': 'name', 'counts': 12 },
+        { 'type': 'char', 'name': 'tags', 'counts': [3, 8] },
+    ],
+    'outer': [
+        { 'type': 'named', 'name': 'items', 'counts': 2 },
+        { 'type': 'char', 'name': 'flag' },
+    ],
+}
+
+
+# a bufferator of a random spec that fits the default limits, and its
+# top type
+def randomBufferator():
+    while True:
+        top, spec = jb.randomspec.makeSpecObject()
+        try:
+            return top, jb.justbuffers.JustBufferator(spec)
+        except jb.justbuffers.ElaborationError:
+            pass
+
+
+# whether a and b are the same value of a leaf. Numbers are compared as
+# the bytes the leaf's struct packs them to, which matches NaNs, and
+# values set from python floats against what the leaf actually stores.
+# decodeColumns leaves bools as the byte stored, so any nonzero byte is
+# True.
+def sameLeaf(l_type, l_struct, a, b):
+    if l_type == 'char':
+        return a == b
+    elif l_type == 'bool':
+        return bool(a) == bool(b)
+    return l_struct.pack(a) == l_struct.pack(b)
+
+
+def checkIndex(j, top):
+    index = j.leafIndex(top)
+    assert list(index) == [ path for path, _ in j.leafPaths(top) ]
+    end = 0
+    for path, (offset, l_type, l_struct) in index.items():
+        assert offset >= end, path
+        end = offset + l_struct.size
+    assert end <= j.elaborated[top]['size']
+
+
+# leaves are checked against decodeColumns, which has a column for
+# every leaf path
+def checkRandom():
+    base_types = jb.justbuffers.get_base_types()
+    for _ in range(20):
+        top, j = randomBufferator()
+        checkIndex(j, top)
+        index = j.leafIndex(top)
+        offset = random.randint(0, 16)
+        data = bytearray(random.randbytes(offset + j.elaborated[top]['size']))
+        before = { path: column[0] for path, column in j.decodeColumns(top, data, 1, offset).items() }
+        for path, (_, l_type, l_struct) in index.items():
+            assert sameLeaf(l_type, l_struct, j.getField(top, data, path, offset), before[path]), path
+
+        changed = {}
+        for path, (_, l_type, l_struct) in random.sample(list(index.items()), min(5, len(index))):
+            changed[path] = base_types[l_type]['rand']()
+            j.setField(top, data, path, changed[path], offset)
+        after = j.decodeColumns(top, data, 1, offset)
+        for path, (_, l_type, l_struct) in index.items():
+            assert sameLeaf(l_type, l_struct, after[path][0], changed.get(path, before[path])), path
+
+
+def checkStrings():
+    j = jb.justbuffers.JustBufferator(STRING_SPEC)
+    checkIndex(j, 'outer')
+    data = bytearray(j.encodeBuffer('outer', {
+        'items': [ { 'id': 1, 'name': 'one', 'tags': [ 'a', 'b', 'c' ] }, { 'id': 2, 'name': 'two' } ],
+        'flag': 'y',
+    }))
+    assert j.getField('outer', data, 'items[0].tags[2]') == 'c'
+    assert j.getField('outer', data, 'items[1].name') == 'two'
+    assert j.getField('outer', data, 'flag') == 'y'
+    j.setField('outer', data, 'items[1].tags[0]', 'eightchr')
+    j.setField('outer', data, 'items[0].name', 'uno')
+    j.setField('outer', data, 'flag', 'n')
+    d = j.decodeBuffer('outer', data)
+    assert d['items'][1]['tags'] == [ 'eightchr', '', '' ]
+    assert d['items'][0]['name'] == 'uno'
+    assert d['items'][0]['tags'] == [ 'a', 'b', 'c' ]
+    assert d['flag'] == 'n'
+
+    try:
+        j.setField('outer', data, 'items[1].tags[0]', 'ninechars')
+        assert False
+    except struct.error:
+        pass
+    for bad in [ 'items[2].id', 'items[0]', 'items[0].tags', 'nope' ]:
+        try:
+            j.getField('outer', data, bad)
+            assert False, bad
+        except KeyError as e:
+            assert bad in str(e)
+
+
+if __name__ == '__main__':
+    print('random specs')
+    checkRandom()
+    print('strings')
+    checkStrings()
+    sys.exit(0)
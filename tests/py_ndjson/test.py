@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import io
+import json
+import random
+import subprocess
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__),'../../'))
+
+import jb.justbuffers
+import jb.ndjson
+
+# This test checks NDJSON conversion:
+#
+# 0. write a file of random c_simple t1 records, with a few stray
+#    bytes at the end
+# 1. decode it with jb.py --format ndjson, and check every line against
+#    decodeMany
+# 2. encode those lines back with jb.py --format ndjson, and check the
+#    binary matches; blank lines are skipped and bad lines reported
+# 3. check that the memory the conversions take does not grow with the
+#    number of records
+
+SPEC = os.path.join(os.path.dirname(__file__), '../c_simple/types.json')
+JB = os.path.join(os.path.dirname(__file__), '../../jb.py')
+
+
+def run(*args):
+    subprocess.run([ sys.executable, JB, '-c', SPEC, '-t', 't1', '--format', 'ndjson' ] + list(args),
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+def peakMemory(fn, *args):
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+if __name__ == '__main__':
+    with open(SPEC, 'r') as ifh:
+        j = jb.justbuffers.JustBufferator(json.loads(ifh.read()))
+    size = j.elaborated['t1']['size']
+    count = 600
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = lambda name: os.path.join(tmp, name)
+        data = random.randbytes(size * count)
+        with open(path('in.bin'), 'wb') as ofh:
+            ofh.write(data + b'extra')
+
+        print('decode')
+        run('-d', path('in.bin'), path('out.ndjson'))
+        with open(path('out.ndjson'), 'r') as ifh:
+            lines = ifh.read().split('\n')
+        assert lines[-1] == ''
+        assert [ json.loads(line) for line in lines[:-1] ] == j.decodeMany('t1', data)
+
+        print('encode')
+        with open(path('in.ndjson'), 'w') as ofh:
+            ofh.write('\n'.join(lines[:10] + [ '', '  ' ] + lines[10:]))
+        run('-e', path('in.ndjson'), path('out.bin'))
+        with open(path('out.bin'), 'rb') as ifh:
+            assert ifh.read() == data
+
+        try:
+            jb.ndjson.encodeFile(j, 't1', io.StringIO(lines[0] + '\n{ nope\n'), io.BytesIO())
+            assert False
+        except ValueError as e:
+            assert 'line 2' in str(e)
+
+        print('memory')
+        # small batches, so that a few of them make up the smaller file
+        jb.ndjson.BATCH_RECORDS = 128
+        peaks = []
+        for n in (1, 4):
+            with open(path('big.bin'), 'wb') as ofh:
+                ofh.write(data * n)
+            with open(path('big.bin'), 'rb') as ifh, open(path('big.ndjson'), 'w') as ofh:
+                decoded = peakMemory(jb.ndjson.decodeFile, j, 't1', ifh, ofh)
+            with open(path('big.ndjson'), 'r') as ifh, open(path('big2.bin'), 'wb') as ofh:
+                encoded = peakMemory(jb.ndjson.encodeFile, j, 't1', ifh, ofh)
+            print(f'  {count * n} records: peak {decoded >> 10} KiB decoding, {encoded >> 10} KiB encoding')
+            peaks.append((decoded, encoded))
+        assert peaks[1][0] < peaks[0][0] * 1.5
+        assert peaks[1][1] < peaks[0][1] * 1.5
+
+    sys.exit(0)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import json
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__),'../../'))
+
+import jb.justbuffers
+import jb.jscompare
+import jb.randomspec
+
+# This test checks that numpyDtype() lays records out exactly like the
+# library does:
+#
+# 0. generate a randomized specification of buffers
+# 1. encode a few records of random values
+# 2. load them with np.frombuffer() using the generated dtype
+# 3. check every value against decodeMany()
+#
+# Just Buffers does not need NumPy, so if it isn't installed, this
+# test is skipped.
+
+def toPython(x):
+    if isinstance(x, numpy.void):
+        return { k: toPython(x[k]) for k in x.dtype.names }
+    elif isinstance(x, numpy.ndarray):
+        return [ toPython(e) for e in x ]
+    return x.item()
+
+
+def checkSpec(spec, top, **kwargs):
+    j = jb.justbuffers.JustBufferator(
+      spec,
+      max_struct_size=2**22,
+      max_nesting_depth=2**8,
+      max_array_elements=2**20,
+      **kwargs
+    )
+    size = j.elaborated[top]['size']
+    dtype = j.numpyDtype(top)
+    if dtype.itemsize != size:
+        print(f'dtype itemsize {dtype.itemsize} != elaborated size {size}')
+        return False
+
+    raw = bytes([ random.randint(0,255) for i in range(size * 3) ])
+    # round trip once so that bools are 0 or 1, as numpy expects
+    records = j.decodeMany(top, j.encodeMany(top, j.decodeMany(top, raw)))
+    array = numpy.frombuffer(j.encodeMany(top, records), dtype=dtype)
+    return jb.jscompare.compareSimple(records, [ toPython(r) for r in array ])
+
+
+if __name__ == '__main__':
+    try:
+        import numpy
+    except ImportError:
+        print('numpy is not installed; skipping')
+        sys.exit(0)
+
+    variants = [
+        {},
+        { 'packed': True },
+        { 'big_endian': True },
+    ]
+
+    for i in range(10):
+        print(f"Iter {i}")
+        max_retries = 100
+        for retry in range(max_retries):
+            try:
+                top, spec = jb.randomspec.makeSpecObject()
+                for variant in variants:
+                    if not checkSpec(spec, top, **variant):
+                        print(f'NumPy check FAILED for {variant}')
+                        print(f"spec was: (top: {top})")
+                        print(json.dumps(spec,indent=2,sort_keys=True))
+                        sys.exit(-1)
+                break
+            except (jb.justbuffers.ElaborationError, jb.justbuffers.SchemaValidationError) as e:
+                if retry == max_retries - 1:
+                    print(f'Failed after {max_retries} retries: {e}')
+                    sys.exit(-1)
+                continue
+
+    sys.exit(0)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import concurrent.futures
+import json
+import random
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__),'../../'))
+
+import jb.justbuffers
+import jb.parallel
+
+# This test checks that jb.py --jobs converts files of records exactly
+# as a single process does:
+#
+# 0. write a file of random c_simple t1 records, with a few stray
+#    bytes at the end
+# 1. decode it with --records alone and with --jobs 3, and check the
+#    json files are identical
+# 2. encode that json back with --records alone and with --jobs 3, and
+#    check the binary files are identical
+# 3. check an empty file, with --jobs and without, that only a few
+#    chunks are submitted ahead of the one being written, and a decode
+#    split into many small chunks
+
+SPEC = os.path.join(os.path.dirname(__file__), '../c_simple/types.json')
+JB = os.path.join(os.path.dirname(__file__), '../../jb.py')
+
+
+def run(*args):
+    subprocess.run([ sys.executable, JB, '-c', SPEC, '-t', 't1', '-r' ] + list(args),
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+def read(path, mode='rb'):
+    with open(path, mode) as ifh:
+        return ifh.read()
+
+
+if __name__ == '__main__':
+    with open(SPEC, 'r') as ifh:
+        j = jb.justbuffers.JustBufferator(json.loads(ifh.read()))
+    size = j.elaborated['t1']['size']
+    count = 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = lambda name: os.path.join(tmp, name)
+        with open(path('in.bin'), 'wb') as ofh:
+            ofh.write(bytes([ random.randint(0, 255) for i in range(size * count + 5) ]))
+
+        print('decode')
+        run('-d', path('in.bin'), path('one.json'))
+        run('-j', '3', '-d', path('in.bin'), path('three.json'))
+        assert read(path('one.json'), 'r') == read(path('three.json'), 'r')
+        assert len(json.loads(read(path('three.json'), 'r'))) == count
+
+        print('encode')
+        run('-e', path('one.json'), path('one.bin'))
+        run('-j', '3', '-e', path('one.json'), path('three.bin'))
+        assert read(path('one.bin')) == read(path('three.bin')) == read(path('in.bin'))[:size * count]
+
+        print('empty')
+        with open(path('empty.bin'), 'wb') as ofh:
+            pass
+        run('-j', '3', '-d', path('empty.bin'), path('empty.json'))
+        assert json.loads(read(path('empty.json'), 'r')) == []
+        run('-d', path('empty.bin'), path('empty.json'))
+        assert json.loads(read(path('empty.json'), 'r')) == []
+
+        print('bounded tasks')
+        taken = []
+        def tasks():
+            for i in range(50):
+                taken.append(i)
+                yield (i,)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+            for i, result in enumerate(jb.parallel.mapBounded(pool, lambda x: x * 2, tasks(), 4)):
+                assert result == i * 2
+                assert len(taken) <= i + 1 + 4
+        assert len(taken) == 50
+
+        print('small chunks')
+        jb.parallel.CHUNK_BYTES = size * 64
+        with open(path('many.json'), 'w') as ofh:
+            jb.parallel.decodeFile(j, {}, 't1', path('in.bin'), ofh, 2)
+        assert read(path('many.json'), 'r') == read(path('one.json'), 'r')
+
+    sys.exit(0)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import json
+import random
+import re
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__),'../../'))
+
+import jb.justbuffers
+import jb.randomspec
+
+# This test checks decoding of selected fields with decodeBuffer(...,
+# fields=...):
+#
+# 0. for random specs, decode random sets of leaf paths, and check
+#    each value against the same path in the full decode
+# 1. with the c_simple spec, plain and with compact_arrays, check
+#    wildcards, whole structs and subarrays, overlapping fields, and
+#    single elements of compact rows
+# 2. check that bad paths are reported
+
+SPEC = os.path.join(os.path.dirname(__file__), '../c_simple/types.json')
+
+
+# follows a path like 't0s[1][0].fee' through a fully decoded record
+def follow(record, path):
+    value = record
+    for name, indices in re.findall(r'([a-zA-Z_][a-zA-Z0-9_]*)((?:\[\d+\])*)', path):
+        value = value[name]
+        for i in re.findall(r'\d+', indices):
+            value = value[int(i)]
+    return value
+
+
+def same(a, b):
+    # NaN != NaN, so compare as json text, where every NaN is written
+    # the same
+    return json.dumps(a, default=repr) == json.dumps(b, default=repr)
+
+
+def randomSpecs(count):
+    for _ in range(count):
+        while True:
+            top, spec = jb.randomspec.makeSpecObject()
+            try:
+                yield top, jb.justbuffers.JustBufferator(spec)
+                break
+            except jb.justbuffers.ElaborationError:
+                pass
+
+
+def checkRandom():
+    for top, j in randomSpecs(20):
+        size = j.elaborated[top]['size']
+        leaves = [ path for path, _ in j.leafPaths(top) ]
+        for _ in range(5):
+            data = random.randbytes(size + 16)
+            offset = random.randint(0, 16)
+            full = j.decodeBuffer(top, data, offset)
+            fields = random.sample(leaves, min(len(leaves), random.randint(1, 5)))
+            projected = j.decodeBuffer(top, data, offset, fields=fields)
+            assert list(projected) == fields
+            for field in fields:
+                assert same(projected[field], follow(full, field)), field
+
+
+def checkSimple(compact):
+    with open(SPEC, 'r') as ifh:
+        j = jb.justbuffers.JustBufferator(json.loads(ifh.read()), compact_arrays=compact)
+    data = random.randbytes(j.elaborated['t1']['size'])
+    full = j.decodeBuffer('t1', data)
+    t0s = full['t0s']
+
+    fields = {
+        'blee': full['blee'],
+        't0s[*][0].fee': [ t0s[0][0]['fee'], t0s[1][0]['fee'] ],
+        't0s[*][*].fi': [ [ t0['fi'] for t0 in row ] for row in t0s ],
+        't0s[1][1].fum[3]': t0s[1][1]['fum'][3],
+        't0s[0][0].fum': t0s[0][0]['fum'],
+        't0s[0][1]': t0s[0][1],
+        't0s[1]': t0s[1],
+        't0s[1][0].fo': t0s[1][0]['fo'],
+    }
+    projected = j.decodeBuffer('t1', data, fields=list(fields))
+    for field, value in fields.items():
+        assert projected[field] == value, field
+
+    # again, now that the plan is cached
+    assert j.decodeBuffer('t1', data, fields=list(fields)) == projected
+    assert j.decodeBuffer('t1', data, fields=[]) == {}
+    assert j.decodeBuffer('t1', data, fields=['t0s'])['t0s'] == t0s
+
+
+def checkErrors():
+    with open(SPEC, 'r') as ifh:
+        j = jb.justbuffers.JustBufferator(json.loads(ifh.read()))
+    data = bytes(j.elaborated['t1']['size'])
+    for bad in [ 'nope', 't0s.fee', 't0s[2][0]', 'blee[0]', 't0s[0][0][0]', 't0s[0][0].', 't0s[-1][0]' ]:
+        try:
+            j.decodeBuffer('t1', data, fields=[ bad ])
+            assert False, bad
+        except ValueError as e:
+            assert bad in str(e)
+
+
+if __name__ == '__main__':
+    print('random specs')
+    checkRandom()
+    print('c_simple')
+    checkSimple(False)
+    print('c_simple, compact arrays')
+    checkSimple(True)
+    print('errors')
+    checkErrors()
+    sys.exit(0)
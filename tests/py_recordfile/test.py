@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import json
+import random
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__),'../../'))
+
+import jb.justbuffers
+import jb.jscompare
+import jb.recordfile
+
+# This test checks memory-mapped record files:
+#
+# 0. write a record file of the c_simple t1 type, with a header
+# 1. check length, indexing, negative indexing, slicing and iteration
+# 2. check that opening it with a different layout of t1, or as
+#    another type, is refused
+# 3. check that a file without a header can be opened as well
+# 4. edit records of a writable file in place and read them back
+
+def loadSpec():
+    with open(os.path.join(os.path.dirname(__file__), '../c_simple/types.json'), 'r') as ifh:
+        return json.loads(ifh.read())
+
+if __name__ == '__main__':
+    j = jb.justbuffers.JustBufferator(loadSpec())
+    size = j.elaborated['t1']['size']
+    count = 2500
+    raw = bytes([ random.randint(0,255) for i in range(size * count) ])
+    records = j.decodeMany('t1', raw)
+
+    with tempfile.TemporaryDirectory() as tdir:
+        path = os.path.join(tdir, 'records.jbrf')
+
+        print('read back')
+        with jb.recordfile.RecordFile.create(j, 't1', path, records) as rf:
+            assert(len(rf) == count)
+            for i in [0, 1, 900, count - 1, -1, -count]:
+                assert(jb.jscompare.compareSimple(records[i], rf[i]))
+            assert(jb.jscompare.compareSimple(records[10:20], rf[10:20]))
+            assert(jb.jscompare.compareSimple(records[::-97], rf[::-97]))
+            assert(jb.jscompare.compareSimple(records, list(rf)))
+            try:
+                rf[count]
+                assert(False)
+            except IndexError:
+                pass
+
+        print('layout mismatch')
+        spec = loadSpec()
+        spec['t0'][1]['type'] = 'u32'
+        other = jb.justbuffers.JustBufferator(spec)
+        for bufferator, t_name in [(other, 't1'), (j, 't0')]:
+            try:
+                jb.recordfile.RecordFile(bufferator, t_name, path)
+                assert(False)
+            except jb.recordfile.RecordFileError as e:
+                print(f'  refused: {e}')
+
+        print('no header')
+        path = os.path.join(tdir, 'records.bin')
+        with open(path, 'wb') as ofh:
+            ofh.write(raw)
+        with jb.recordfile.RecordFile(j, 't1', path) as rf:
+            assert(len(rf) == count)
+            assert(jb.jscompare.compareSimple(records[-1], rf[-1]))
+
+        print('edit in place')
+        with jb.recordfile.RecordFile(j, 't1', path, writable=True) as rf:
+            rf.view(900).t0s[1][0].fee = 0x12345678
+            rf[901] = records[0]
+        with jb.recordfile.RecordFile(j, 't1', path) as rf:
+            records[900]['t0s'][1][0]['fee'] = 0x12345678
+            assert(jb.jscompare.compareSimple(records[900], rf[900]))
+            assert(jb.jscompare.compareSimple(records[0], rf[901]))
+            assert(jb.jscompare.compareSimple(records[902], rf[902]))
+
+    sys.exit(0)
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+import array
+import sys
+import os
+import json
+import re
+import struct
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__),'../../'))
+
+import jb.justbuffers
+import jb.jscompare
+import jb.randomspec
+import jb.util
+
+# This test needs no compilers. It consists of the following steps:
+#
+# 0. generate a randomized specification of buffers
+# 1. fill a buffer of the top type with random values
+# 2. encode it, and check the encoding has the elaborated size
+# 3. decode it again, and check that it matches the input
+# 4. encode the decoded buffer and check that the bytes match,
+#    and decode it again from (and encode it into) an offset inside a
+#    larger buffer, also decoding into an earlier decoded record
+# 5. encode and decode several consecutive records at once, both as
+#    records and as columns
+# 6. generate a standalone python module and check that it encodes
+#    and decodes exactly as the library does
+#
+# This is repeated for both packed and unpacked, little and
+# big-endian variants. Random specs have no strings, so char arrays,
+# nested structs holding strings and compact_arrays decoding are
+# checked separately with fixed specs.
+
+def randomizeBufferFromSpec(spec, top):
+
+    def makeOne(mi):
+        if mi['type'] in jb.justbuffers.get_base_types():
+            return jb.justbuffers.get_base_types()[mi['type']]['rand']()
+        else:
+            return randomizeBufferFromSpec(spec, mi['type'])
+
+    def randomizeMember(mi):
+        count = jb.util.total_array_count(mi)
+        vals = [ makeOne(mi) for i in range(count) ]
+        return jb.util.unflattenArray(vals, mi['counts'])
+
+    ov = {}
+    for mi in spec[top]['members']:
+        ov[mi['name']] = randomizeMember(mi)
+    return ov
+
+
+def getPath(data, path):
+    for part in re.findall(r'\[\d+\]|\w+', path):
+        data = data[int(part[1:-1])] if part.startswith('[') else data[part]
+    return data
+
+
+def roundTrip(spec, top, **kwargs):
+    j = jb.justbuffers.JustBufferator(
+      spec,
+      max_struct_size=2**22,
+      max_nesting_depth=2**8,
+      max_array_elements=2**20,
+      **kwargs
+    )
+    tb = randomizeBufferFromSpec(j.elaborated, top)
+    encoded = j.encodeBuffer(top, tb)
+    if len(encoded) != j.elaborated[top]['size']:
+        print(f'Encoded size {len(encoded)} != elaborated size {j.elaborated[top]["size"]}')
+        return False
+    decoded = j.decodeBuffer(top, encoded)
+    if not jb.jscompare.compareSimple(tb, decoded):
+        return False
+    if j.encodeBuffer(top, decoded) != encoded:
+        print('Re-encoded buffer differs')
+        return False
+
+    # decoding in place from the middle of a larger buffer
+    framed = memoryview(bytearray(3) + encoded + bytearray(5))
+    if not jb.jscompare.compareSimple(decoded, j.decodeBuffer(top, framed, 3)):
+        print('Decode at offset differs')
+        return False
+
+    # decoding into the previous decoding of another record reuses it
+    target = j.decodeBuffer(top, j.encodeBuffer(top, randomizeBufferFromSpec(j.elaborated, top)))
+    if j.decodeInto(top, framed, target, 3) is not target or not jb.jscompare.compareSimple(decoded, target):
+        print('decodeInto differs')
+        return False
+
+    # and encoding in place into the middle of a larger buffer
+    framed = bytearray(b'\xff' * (len(encoded) + 8))
+    if j.encodeInto(top, tb, framed, 3) != len(encoded) or framed != (
+            b'\xff' * 3 + encoded + b'\xff' * 5):
+        print('encodeInto differs')
+        return False
+
+    # several records at once
+    many = j.encodeMany(top, [tb, decoded, tb])
+    if many != encoded * 3:
+        print('encodeMany differs')
+        return False
+    if not jb.jscompare.compareSimple([tb, tb, tb], j.decodeMany(top, many)):
+        print('decodeMany differs')
+        return False
+
+    # and as columns, one per leaf
+    columns = j.decodeColumns(top, many)
+    if len(columns) != len(j.leafPaths(top)):
+        print('decodeColumns has the wrong number of columns')
+        return False
+    for path, column in columns.items():
+        if len(column) != 3 or not jb.jscompare.compareSimple(getPath(decoded, path), column[1]):
+            print(f'decodeColumns differs at {path}')
+            return False
+
+    generated = types.ModuleType('generated')
+    exec(compile(j.generatePython(), 'generated.py', 'exec'), generated.__dict__)
+    if generated.ENCODERS[top](tb) != encoded:
+        print('Generated module encoded differently')
+        return False
+    if not jb.jscompare.compareSimple(decoded, generated.DECODERS[top](encoded)):
+        print('Generated module decoded differently')
+        return False
+    return True
+
+
+STRING_SPEC = {
+    'tag': [
+        { 'name': 'id',    'type': 'u16' },
+        { 'name': 'name',  'type': 'char', 'counts': 12 },
+        { 'name': 'alts',  'type': 'char', 'counts': [3, 5] },
+        { 'name': 'ok',    'type': 'bool' },
+        { 'name': 'v',     'type': 'float', 'counts': 4 },
+        { 'name': 'raw',   'type': 'u8', 'counts': [2, 3] },
+    ],
+    'rec': [
+        { 'name': 't',     'type': 'tag', 'counts': 2 },
+        { 'name': 'label', 'type': 'char' },
+        { 'name': 'n',     'type': 'u32' },
+    ],
+}
+
+STRING_DATA = {
+    't': [
+        { 'id': 3, 'name': 'h\u00e9llo', 'alts': ['a', 'bb', 'ccccc'], 'ok': True,
+          'v': [1.0, 2.0, 3.0, 4.0], 'raw': [[1, 2, 3], [4, 5, 6]] },
+        { 'id': 4, 'name': 'x' * 12 },
+    ],
+    'label': 'z',
+    'n': 9,
+}
+
+
+def stringsRoundTrip(**kwargs):
+    j = jb.justbuffers.JustBufferator(STRING_SPEC, **kwargs)
+    encoded = j.encodeBuffer('rec', STRING_DATA)
+    decoded = j.decodeBuffer('rec', encoded)
+    t0, t1 = decoded['t']
+    assert t0['name'] == 'h\u00e9llo' and t1['name'] == 'x' * 12
+    assert t0['alts'] == ['a', 'bb', 'ccccc'] and t1['alts'] == ['', '', '']
+    assert decoded['label'] == 'z'
+    assert j.encodeBuffer('rec', decoded) == encoded
+
+    # whole members given as buffers or flat lists encode the same
+    for raw in (bytes([1, 2, 3, 4, 5, 6]), array.array('B', [1, 2, 3, 4, 5, 6]), [1, 2, 3, 4, 5, 6]):
+        t = dict(STRING_DATA['t'][0], raw=raw, v=array.array('f', [1.0, 2.0, 3.0, 4.0]))
+        assert j.encodeBuffer('rec', dict(STRING_DATA, t=[t, STRING_DATA['t'][1]])) == encoded
+    assert j.decodeColumns('rec', encoded * 2)['t[0].alts[2]'] == ['ccccc', 'ccccc']
+    assert j.view('rec', encoded).t[0].alts[1] == 'bb'
+    try:
+        j.encodeBuffer('rec', { 'label': 'ab' })
+        assert False, 'over-long string was accepted'
+    except struct.error:
+        pass
+
+    target = j.decodeBuffer('rec', j.encodeBuffer('rec', { 'n': 1 }))
+    t_list, v = target['t'], target['t'][0]['v']
+    assert j.decodeInto('rec', encoded, target) == decoded
+    assert target['t'] is t_list and target['t'][0]['v'] is v
+
+    if kwargs.get('compact_arrays'):
+        assert isinstance(t0['v'], array.array) and list(t0['v']) == [1.0, 2.0, 3.0, 4.0]
+        assert t0['raw'] == [b'\x01\x02\x03', b'\x04\x05\x06']
+        assert t0['ok'] is True
+    else:
+        assert t0['v'] == [1.0, 2.0, 3.0, 4.0] and t0['raw'] == [[1, 2, 3], [4, 5, 6]]
+        generated = types.ModuleType('generated')
+        exec(compile(j.generatePython(), 'generated.py', 'exec'), generated.__dict__)
+        assert generated.encode_rec(STRING_DATA) == encoded
+        assert generated.decode_rec(encoded) == decoded
+    return True
+
+
+NESTED_STRING_SPEC = {
+    'inner': [
+        { 'name': 'n', 'type': 'u8' },
+        { 'name': 's', 'type': 'char', 'counts': 8 },
+    ],
+    'outer': [
+        { 'name': 'a', 'type': 'inner' },
+        { 'name': 'b', 'type': 'inner', 'counts': 2 },
+        { 'name': 'x', 'type': 'u32' },
+    ],
+}
+
+
+# missing and short nested structs holding strings are filled with
+# empty strings by the generated module, as by the library
+def nestedStringsRoundTrip(**kwargs):
+    j = jb.justbuffers.JustBufferator(NESTED_STRING_SPEC, **kwargs)
+    generated = types.ModuleType('generated')
+    exec(compile(j.generatePython(), 'generated.py', 'exec'), generated.__dict__)
+    for data in [ { 'x': 1 }, { 'b': [ { 'n': 2, 's': 'two' } ], 'x': 3 }, {} ]:
+        encoded = generated.encode_outer(data)
+        assert encoded == j.encodeBuffer('outer', data)
+        assert generated.decode_outer(encoded) == j.decodeBuffer('outer', encoded)
+    return True
+
+
+if __name__ == '__main__':
+
+    for variant in [ {}, { 'big_endian': True }, { 'compact_arrays': True },
+                     { 'compact_arrays': True, 'big_endian': True, 'packed': True } ]:
+        stringsRoundTrip(**variant)
+    for variant in [ {}, { 'big_endian': True }, { 'packed': True } ]:
+        nestedStringsRoundTrip(**variant)
+
+    variants = [
+        {},
+        { 'packed': True },
+        { 'big_endian': True },
+        { 'packed': True, 'big_endian': True },
+    ]
+
+    for i in range(10):
+        print(f"Iter {i}")
+        max_retries = 100
+        for retry in range(max_retries):
+            try:
+                top, spec = jb.randomspec.makeSpecObject()
+                for variant in variants:
+                    if not roundTrip(spec, top, **variant):
+                        print(f'Round trip FAILED for {variant}')
+                        print(f"spec was: (top: {top})")
+                        print(json.dumps(spec,indent=2,sort_keys=True))
+                        sys.exit(-1)
+                break
+            except (jb.justbuffers.ElaborationError, jb.justbuffers.SchemaValidationError) as e:
+                if retry == max_retries - 1:
+                    print(f'Failed after {max_retries} retries: {e}')
+                    sys.exit(-1)
+                continue
+
+    sys.exit(0)
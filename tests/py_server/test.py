@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import json
+import random
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__),'../../'))
+
+import jb.justbuffers
+import jb.jscompare
+import jb.server
+
+# This test runs the codec server, as jb.py --serve does:
+#
+# 0. start jb.py --serve with the c_simple spec, plus a second small
+#    spec under another name
+# 1. from several concurrent clients, decode and encode single records
+#    and runs of records, and check them against the library
+# 2. check that a bad request gets an error reply and leaves the
+#    connection usable
+# 3. report the round trip time of a request
+# 4. check that a second server refuses the socket of a live one, and
+#    that a stale socket is replaced but a file that isn't a socket is
+#    left alone
+
+SPEC = os.path.join(os.path.dirname(__file__), '../c_simple/types.json')
+JB = os.path.join(os.path.dirname(__file__), '../../jb.py')
+OTHER_SPEC = { 'point': [ { 'name': 'x', 'type': 'i32' }, { 'name': 'y', 'type': 'i32' } ] }
+
+
+def randomRecords(j, count):
+    size = j.elaborated['t1']['size']
+    return j.decodeMany('t1', bytes([ random.randint(0,255) for i in range(size * count) ]))
+
+
+def exercise(path, j, failures):
+    try:
+        with jb.server.Client(path) as client:
+            for _ in range(20):
+                records = randomRecords(j, 5)
+                encoded = client.encode('t1', records[0])
+                assert encoded == j.encodeBuffer('t1', records[0])
+                assert jb.jscompare.compareSimple(records[0], client.decode('t1', encoded))
+                many = client.encode('t1', records, records=True)
+                assert many == j.encodeMany('t1', records)
+                assert jb.jscompare.compareSimple(records, client.decode('t1', many, records=True))
+                point = { 'x': random.randint(-100, 100), 'y': 7 }
+                assert client.decode('point', client.encode('point', point, spec='other'), spec='other') == point
+    except Exception as e:
+        failures.append(e)
+        raise
+
+
+if __name__ == '__main__':
+    with open(SPEC, 'r') as ifh:
+        j = jb.justbuffers.JustBufferator(json.loads(ifh.read()))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        other_spec = os.path.join(tmp, 'other.json')
+        with open(other_spec, 'w') as ofh:
+            json.dump(OTHER_SPEC, ofh)
+        path = os.path.join(tmp, 'jb.sock')
+        proc = subprocess.Popen(
+            [ sys.executable, JB, '-c', SPEC, '--serve-config', f'other={other_spec}', '--serve', path ],
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            for _ in range(200):
+                if os.path.exists(path):
+                    break
+                time.sleep(0.05)
+            assert os.path.exists(path), 'server did not start'
+
+            print('concurrent clients')
+            failures = []
+            threads = [ threading.Thread(target=exercise, args=(path, j, failures)) for _ in range(8) ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            assert not failures, failures
+
+            print('errors')
+            with jb.server.Client(path) as client:
+                try:
+                    client.decode('no_such_type', b'')
+                    assert False
+                except jb.server.ServerError as e:
+                    assert 'no_such_type' in str(e)
+                try:
+                    client.decode('t1', b'short')
+                    assert False
+                except jb.server.ServerError:
+                    pass
+                assert client.types() == { t: i['size'] for t, i in j.elaborated.items() }
+
+                print('latency')
+                encoded = j.encodeBuffer('t1', randomRecords(j, 1)[0])
+                count = 1000
+                start = time.perf_counter()
+                for _ in range(count):
+                    client.decode('t1', encoded)
+                print(f'  {(time.perf_counter() - start) / count * 1e6:.0f} us per decode request')
+
+            print('socket path')
+            second = subprocess.run(
+                [ sys.executable, JB, '-c', SPEC, '--serve', path ],
+                stdout=subprocess.PIPE, text=True,
+            )
+            assert second.returncode != 0
+            assert 'already listening' in second.stdout
+            with jb.server.Client(path) as client:
+                assert 't1' in client.types()
+        finally:
+            proc.terminate()
+            proc.wait()
+        assert not os.path.exists(path), 'server left its socket behind'
+
+        # a socket nobody listens on, as left by a server that was killed
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        server = jb.server.CodecServer(path, { jb.server.DEFAULT_SPEC: j })
+        server.server_close()
+
+        not_socket = os.path.join(tmp, 'not.sock')
+        with open(not_socket, 'w') as ofh:
+            ofh.write('keep me')
+        try:
+            jb.server.CodecServer(not_socket, { jb.server.DEFAULT_SPEC: j })
+            assert False
+        except FileExistsError:
+            pass
+        with open(not_socket, 'r') as ifh:
+            assert ifh.read() == 'keep me'
+
+    sys.exit(0)
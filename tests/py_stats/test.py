@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import json
+import random
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__),'../../'))
+
+import jb.justbuffers
+
+# This test checks the stats a bufferator keeps:
+#
+# 0. check that a new bufferator reports its elaboration, and counts
+#    nothing until stats are enabled
+# 1. with stats enabled, run encodes and decodes of several kinds and
+#    check the calls, records and bytes counted for each type, and the
+#    calls the hook saw
+# 2. check that counts from several threads at once add up, messages
+#    included
+# 3. check that disabling stats removes the counting, and that
+#    elaboration from the cache is reported as such
+
+SPEC = os.path.join(os.path.dirname(__file__), '../c_simple/types.json')
+
+
+def counts(j, t_name, direction):
+    return j.stats()['types'][t_name][direction]
+
+
+if __name__ == '__main__':
+    with open(SPEC, 'r') as ifh:
+        spec = json.loads(ifh.read())
+    j = jb.justbuffers.JustBufferator(spec)
+    t0_size = j.elaborated['t0']['size']
+    t1_size = j.elaborated['t1']['size']
+    data = random.randbytes(t1_size * 10)
+
+    print('disabled')
+    stats = j.stats()
+    assert stats['elaboration']['seconds'] > 0
+    assert stats['elaboration']['cached'] == False
+    assert stats['elaboration']['messages'] == { 'info': len(j.elab_messages) }
+    assert not stats['enabled']
+    j.decodeBuffer('t1', data)
+    assert j.stats()['types'] == {}
+
+    print('enabled')
+    calls = []
+    j.enableStats(hook=lambda *args: calls.append(args))
+    records = j.decodeMany('t1', data)
+    j.decodeBuffer('t1', data, t1_size)
+    j.decodeInto('t1', data, records[0])
+    j.decodeColumns('t1', data, 4)
+    encoded = j.encodeMany('t1', records[:3])
+    j.encodeBuffer('t1', records[0])
+    j.encodeInto('t1', records[0], bytearray(t1_size))
+    j.encodeBuffer('t0', { 'fum': [ 1, 2 ] })
+
+    decode = counts(j, 't1', 'decode')
+    assert decode['calls'] == 4
+    assert decode['records'] == 10 + 1 + 1 + 4
+    assert decode['bytes'] == decode['records'] * t1_size
+    assert 0 < decode['max_seconds'] <= decode['seconds']
+    encode = counts(j, 't1', 'encode')
+    assert encode['calls'] == 3
+    assert encode['records'] == 5
+    assert encode['bytes'] == 5 * t1_size
+    assert encode['messages'] == 0
+    assert counts(j, 't0', 'encode')['messages'] == 1
+    assert counts(j, 't0', 'decode')['calls'] == 0
+
+    assert len(calls) == 8
+    assert calls[0][:4] == ('decodeMany', 't1', 10, 10 * t1_size)
+    assert calls[-1][:4] == ('encodeBuffer', 't0', 1, t0_size)
+
+    print('threads')
+    j.resetStats()
+    assert j.stats()['types'] == {}
+    def work():
+        for _ in range(500):
+            j.decodeBuffer('t1', data)
+    threads = [ threading.Thread(target=work) for _ in range(4) ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert counts(j, 't1', 'decode')['calls'] == 2000
+
+    # encodes with and without messages at once: each call counts its
+    # own messages, whatever other threads encode meanwhile
+    full_t0 = j.decodeBuffer('t0', data)
+    def encode(value):
+        for _ in range(2000):
+            j.encodeBuffer('t0', value)
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    threads = [ threading.Thread(target=encode, args=(v,)) for v in ({ 'fum': [ 1, 2 ] }, full_t0) * 2 ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    sys.setswitchinterval(interval)
+    assert counts(j, 't0', 'encode')['calls'] == 8000
+    assert counts(j, 't0', 'encode')['messages'] == 4000
+
+    print('disabling')
+    j.disableStats()
+    assert not j.stats()['enabled']
+    j.decodeBuffer('t1', data)
+    assert counts(j, 't1', 'decode')['calls'] == 2000
+    assert 'decodeBuffer' not in j.__dict__
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jb.justbuffers.JustBufferator(spec, cache_dir=tmp)
+        cached = jb.justbuffers.JustBufferator(spec, cache_dir=tmp)
+        assert cached.stats()['elaboration']['cached']
+
+    sys.exit(0)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import io
+import json
+import random
+import socket
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__),'../../'))
+
+import jb.justbuffers
+import jb.jscompare
+import jb.stream
+
+# This test checks the incremental readers against decodeMany:
+#
+# 0. encode a run of records of the c_simple t1 type
+# 1. read them back with a RecordReader from a file object, both
+#    as new records and reusing a single record
+# 2. read them back with a RecordReader from a socket that
+#    is written in randomly sized pieces
+# 3. read a record from a buffered pipe whose writer then stalls, and
+#    check it arrives without waiting for more data
+# 4. feed them in randomly sized pieces to a RecordParser
+# 5. check that a truncated stream is reported
+
+def makeRecords(j, count):
+    size = j.elaborated['t1']['size']
+    raw = bytes([ random.randint(0,255) for i in range(size * count) ])
+    return j.decodeMany('t1', raw)
+
+def writeInPieces(sock, data):
+    i = 0
+    while i < len(data):
+        n = random.randint(1, 1000)
+        sock.sendall(data[i:i+n])
+        i += n
+    sock.close()
+
+def writeAndStall(fd, data, received):
+    os.write(fd, data)
+    # hold the pipe open until the reader has the record, or give up
+    received.wait(10)
+    os.close(fd)
+
+if __name__ == '__main__':
+    with open(os.path.join(os.path.dirname(__file__), '../c_simple/types.json'), 'r') as ifh:
+        j = jb.justbuffers.JustBufferator(json.loads(ifh.read()))
+
+    records = makeRecords(j, 50)
+    encoded = j.encodeMany('t1', records)
+
+    print('file reader')
+    got = list(jb.stream.RecordReader(j, 't1', io.BytesIO(encoded), records_per_read=3))
+    assert(jb.jscompare.compareSimple(records, got))
+
+    print('reusing file reader')
+    got = []
+    for record in jb.stream.RecordReader(j, 't1', io.BytesIO(encoded), records_per_read=7, reuse=True):
+        assert(jb.jscompare.compareSimple(records[len(got)], record))
+        got.append(record)
+    assert(len(got) == len(records) and all(r is got[0] for r in got))
+
+    print('socket reader')
+    a, b = socket.socketpair()
+    writer = threading.Thread(target=writeInPieces, args=(a, encoded))
+    writer.start()
+    got = list(jb.stream.RecordReader(j, 't1', b))
+    writer.join()
+    b.close()
+    assert(jb.jscompare.compareSimple(records, got))
+
+    print('pipe reader')
+    r, w = os.pipe()
+    received = threading.Event()
+    writer = threading.Thread(target=writeAndStall, args=(w, encoded[:j.elaborated['t1']['size']], received))
+    writer.start()
+    with os.fdopen(r, 'rb') as pipe:
+        for record in jb.stream.RecordReader(j, 't1', pipe):
+            stalled = writer.is_alive()
+            received.set()
+            break
+    writer.join()
+    assert(stalled and jb.jscompare.compareSimple(records[0], record))
+
+    print('push parser')
+    parser = jb.stream.RecordParser(j, 't1')
+    got = []
+    i = 0
+    while i < len(encoded):
+        n = random.randint(1, 2000)
+        got += parser.feed(encoded[i:i+n])
+        assert(parser.buffered() < j.elaborated['t1']['size'])
+        i += n
+    parser.close()
+    assert(jb.jscompare.compareSimple(records, got))
+
+    print('truncated stream')
+    try:
+        list(jb.stream.RecordReader(j, 't1', io.BytesIO(encoded[:-3])))
+        assert(False)
+    except EOFError:
+        pass
+
+    sys.exit(0)
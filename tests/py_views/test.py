@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import array
+import json
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__),'../../'))
+
+import jb.justbuffers
+import jb.jscompare
+import jb.randomspec
+
+# This test checks lazy views against decodeBuffer:
+#
+# 0. generate a randomized specification of buffers
+# 1. fill a buffer with random bytes and decode it the usual way
+# 2. walk a view of the same buffer, member by member and element
+#    by element, and check every value against the decoded one
+# 3. write the decoded values into a zeroed buffer through a view,
+#    one member at a time, and check it matches the original bytes
+# 4. change single elements through a view and check that only
+#    those elements changed
+#
+# This is repeated for both packed and unpacked, little and
+# big-endian variants. Views of a compact_arrays bufferator are checked
+# separately with a fixed spec: their arrays decode to bytes and
+# array.array rows, as decodeBuffer's do.
+
+def checkView(view, decoded):
+    if isinstance(decoded, dict):
+        assert(set(view) == set(decoded))
+        for k, v in decoded.items():
+            if not checkView(view[k], v):
+                return False
+        return jb.jscompare.compareSimple(view._decode(), decoded)
+    elif isinstance(decoded, list):
+        assert(len(view) == len(decoded))
+        for i, v in enumerate(decoded):
+            if not checkView(view[i], v):
+                return False
+        return jb.jscompare.compareSimple(view._decode(), decoded)
+    return jb.jscompare.compareSimple(view, decoded)
+
+
+def checkSpec(spec, top, **kwargs):
+    j = jb.justbuffers.JustBufferator(
+      spec,
+      max_struct_size=2**22,
+      max_nesting_depth=2**8,
+      max_array_elements=2**20,
+      **kwargs
+    )
+    offset = random.randint(0, 16)
+    size = j.elaborated[top]['size']
+    raw = bytearray([ random.randint(0,255) for i in range(offset + size) ])
+    decoded = j.decodeBuffer(top, raw, offset)
+    if not checkView(j.view(top, raw, offset), decoded):
+        return False
+
+    written = bytearray(offset + size)
+    view = j.view(top, written, offset)
+    for k, v in decoded.items():
+        view[k] = v
+    if written != bytearray(offset) + j.encodeBuffer(top, decoded):
+        print('Writing through a view gave different bytes')
+        return False
+
+    for k, v in decoded.items():
+        if isinstance(v, (dict, list)):
+            continue
+        new_value = not v if isinstance(v, bool) else 0
+        setattr(view, k, new_value)
+        expected = dict(decoded)
+        expected[k] = new_value
+        if not jb.jscompare.compareSimple(expected, j.decodeBuffer(top, written, offset)):
+            print(f'Setting {k} through a view changed something else')
+            return False
+        setattr(view, k, v)
+    return True
+
+
+COMPACT_SPEC = {
+    'inner': [
+        { 'name': 'raw', 'type': 'u8',    'counts': [2, 3] },
+        { 'name': 's',   'type': 'i8',    'counts': 5 },
+        { 'name': 'w',   'type': 'u16',   'counts': 3 },
+        { 'name': 'f',   'type': 'float', 'counts': 4 },
+        { 'name': 'ok',  'type': 'bool',  'counts': 2 },
+    ],
+    'outer': [
+        { 'name': 'items', 'type': 'inner',  'counts': 2 },
+        { 'name': 'd',     'type': 'double', 'counts': [2, 2] },
+        { 'name': 'n',     'type': 'u32' },
+    ],
+}
+
+
+# array.array rows as their type and bytes, since random floats may be
+# NaN and NaN != NaN
+def rows(value):
+    if isinstance(value, dict):
+        return { k: rows(v) for k, v in value.items() }
+    elif isinstance(value, list):
+        return [ rows(v) for v in value ]
+    elif isinstance(value, array.array):
+        return (value.typecode, value.tobytes())
+    return value
+
+
+def checkCompact(**kwargs):
+    j = jb.justbuffers.JustBufferator(COMPACT_SPEC, compact_arrays=True, **kwargs)
+    offset = random.randint(0, 16)
+    raw = bytearray(random.randbytes(offset + j.elaborated['outer']['size']))
+    decoded = j.decodeBuffer('outer', raw, offset)
+    view = j.view('outer', raw, offset)
+    assert rows(view._decode()) == rows(decoded)
+    assert rows(view.d._decode()) == rows(decoded['d'])
+    for item, d_item in zip(view.items, decoded['items']):
+        for name, value in d_item.items():
+            if isinstance(value, int):
+                continue
+            assert rows(item[name]._decode()) == rows(value), name
+    assert isinstance(view.items[0].raw[1]._decode(), bytes)
+    assert isinstance(view.items[0].s._decode(), bytes)
+    assert isinstance(view.items[0].w._decode(), array.array)
+    assert isinstance(view.items[0].ok._decode(), list)
+
+
+if __name__ == '__main__':
+
+    for variant in [ {}, { 'packed': True }, { 'big_endian': True } ]:
+        checkCompact(**variant)
+
+    variants = [
+        {},
+        { 'packed': True },
+        { 'big_endian': True },
+    ]
+
+    for i in range(10):
+        print(f"Iter {i}")
+        max_retries = 100
+        for retry in range(max_retries):
+            try:
+                top, spec = jb.randomspec.makeSpecObject()
+                for variant in variants:
+                    if not checkSpec(spec, top, **variant):
+                        print(f'View check FAILED for {variant}')
+                        print(f"spec was: (top: {top})")
+                        print(json.dumps(spec,indent=2,sort_keys=True))
+                        sys.exit(-1)
+                break
+            except (jb.justbuffers.ElaborationError, jb.justbuffers.SchemaValidationError) as e:
+                if retry == max_retries - 1:
+                    print(f'Failed after {max_retries} retries: {e}')
+                    sys.exit(-1)
+                continue
+
+    sys.exit(0)